@@ -0,0 +1,184 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from bitboard_state import BETWEEN, BLACK_DIRS, BLACK_PROMOTION, RAYS, WHITE_PROMOTION, BitboardGameState
+from custom_types import DRAW_QUIET_PLIES, PlayerType
+
+# (black, white, kings, black to move, plies since the last capture or man move)
+Position = Tuple[int, int, int, bool, int]
+
+_NO_WINNER, _BLACK_WINS, _WHITE_WINS = 0, 1, 2
+
+
+def _build_actions():
+    # one action per (square, direction, distance): a simple move when nothing is in
+    # between, a capture when exactly one opponent piece is
+    sources, landings, between, distances, forward = [], [], [], [], []
+    for square in range(32):
+        for direction, ray in enumerate(RAYS[square]):
+            for distance, target in enumerate(ray, start=1):
+                sources.append(1 << square)
+                landings.append(1 << target)
+                between.append(BETWEEN[square][target])
+                distances.append(distance)
+                forward.append(direction in BLACK_DIRS)
+    return (np.array(sources, dtype=np.uint32),
+            np.array(landings, dtype=np.uint32),
+            np.array(between, dtype=np.uint32),
+            np.array(distances, dtype=np.int8),
+            np.array(forward, dtype=bool))
+
+
+_SOURCES, _LANDINGS, _BETWEEN, _DISTANCES, _BLACK_FORWARD = _build_actions()
+_WHITE_FORWARD = ~_BLACK_FORWARD
+_ZERO = np.uint32(0)
+_ONE = np.uint32(1)
+_BLACK_PROMOTION = np.uint32(BLACK_PROMOTION)
+_WHITE_PROMOTION = np.uint32(WHITE_PROMOTION)
+
+
+def state_position(state) -> Position:
+    if not isinstance(state, BitboardGameState):
+        state = BitboardGameState.from_game_state(state)
+    # repetitions are not tracked in the batch, a position already drawn by one is passed
+    # as drawn by the no-progress rule instead
+    quiet_plies = DRAW_QUIET_PLIES if state.is_draw() else state.quiet_plies
+    return state.black, state.white, state.kings, state.player == PlayerType.BLACK, quiet_plies
+
+
+class BatchRollout:
+    """Plays B random games in lockstep on NumPy arrays of bitboards.
+
+    Every step each unfinished game makes one single move or one jump, drawn uniformly
+    from its legal actions. A multi-jump is played jump by jump, so compared to
+    MCTSNode.simulate the distribution over whole capture sequences differs slightly,
+    the rules do not: captures are mandatory, jumped pieces leave the board at once, a
+    man reaching the last row mid-chain continues as a king and keeps the crown only
+    if the chain ends there. Of the draw rules only the no-progress one is applied.
+    """
+
+    def __init__(self, max_depth: int = 200, seed: int | None = None):
+        self.max_depth = max_depth
+        self.rng = np.random.default_rng(seed)
+
+    def simulate_states(self, states: Sequence) -> List[PlayerType | None]:
+        return self.simulate([state_position(state) for state in states])
+
+    def simulate(self, positions: Sequence[Position]) -> List[PlayerType | None]:
+        if not positions:
+            return []
+
+        black = np.array([p[0] for p in positions], dtype=np.uint32)
+        white = np.array([p[1] for p in positions], dtype=np.uint32)
+        kings = np.array([p[2] for p in positions], dtype=np.uint32)
+        black_to_move = np.array([p[3] for p in positions], dtype=bool)
+        quiet = np.array([p[4] for p in positions], dtype=np.int32)
+
+        size = len(positions)
+        winner = np.full(size, _NO_WINNER, dtype=np.int8)
+        active = np.ones(size, dtype=bool)
+        plies = np.zeros(size, dtype=np.int32)
+        chain = np.zeros(size, dtype=np.uint32) # piece in the middle of a multi-jump, 0 if none
+        chain_man = np.zeros(size, dtype=bool) # that piece started the multi-jump as a man
+
+        while True:
+            index = np.flatnonzero(active)
+            if index.size == 0:
+                break
+
+            b, w, k, btm, ch = black[index], white[index], kings[index], black_to_move[index], chain[index]
+
+            # a side without pieces has lost, black is checked first like GameState.status,
+            # then a drawn game ends without a winner
+            no_black, no_white = b == _ZERO, w == _ZERO
+            finished = no_black | no_white
+            winner[index[no_black]] = _WHITE_WINS
+            winner[index[no_white & ~no_black]] = _BLACK_WINS
+            finished |= quiet[index] >= DRAW_QUIET_PLIES
+
+            own = np.where(btm, b, w)
+            opp = np.where(btm, w, b)
+            simple, capture = _legal_actions(b | w, own, opp, k, btm)
+
+            in_chain = ch != _ZERO
+            capture[in_chain] &= _SOURCES[None, :] == ch[in_chain, None]
+            has_capture = capture.any(axis=1)
+            legal = np.where(has_capture[:, None], capture, simple)
+            has_move = legal.any(axis=1)
+
+            # a multi-jump with no further jump ends the move
+            chain_end = in_chain & ~has_capture & ~finished
+            if chain_end.any():
+                ended = index[chain_end]
+                demote = chain_man[ended] & ((chain[ended] & np.where(black_to_move[ended], _BLACK_PROMOTION, _WHITE_PROMOTION)) == _ZERO)
+                kings[ended[demote]] &= ~chain[ended[demote]]
+                chain[ended] = _ZERO
+                chain_man[ended] = False
+                black_to_move[ended] = ~black_to_move[ended]
+                plies[ended] += 1
+
+            stuck = ~in_chain & ~has_move & ~finished
+            winner[index[stuck]] = np.where(btm[stuck], _WHITE_WINS, _BLACK_WINS)
+            active[index[finished | stuck]] = False
+
+            moving = has_move & ~finished & ~chain_end
+            if not moving.any():
+                continue
+            self._apply_random_actions(index[moving], legal[moving], own[moving], opp[moving], k[moving], btm[moving],
+                                       black, white, kings, black_to_move, chain, chain_man, plies, quiet)
+
+            over_depth = active & (plies > self.max_depth)
+            active[over_depth] = False
+
+        return [None if code == _NO_WINNER else (PlayerType.BLACK if code == _BLACK_WINS else PlayerType.WHITE)
+                for code in winner.tolist()]
+
+    def _apply_random_actions(self, index, legal, own, opp, k, btm,
+                              black, white, kings, black_to_move, chain, chain_man, plies, quiet):
+        scores = self.rng.random(legal.shape)
+        scores[~legal] = -1.0
+        actions = scores.argmax(axis=1)
+
+        source, landing = _SOURCES[actions], _LANDINGS[actions]
+        captured = opp & _BETWEEN[actions]
+        is_capture = captured != _ZERO
+        was_king = (k & source) != _ZERO
+        promotes = (landing & np.where(btm, _BLACK_PROMOTION, _WHITE_PROMOTION)) != _ZERO
+
+        own = own & ~source | landing
+        opp = opp & ~captured
+        k = k & ~source & ~captured
+        k |= np.where(was_king | promotes, landing, _ZERO)
+
+        black[index] = np.where(btm, own, opp)
+        white[index] = np.where(btm, opp, own)
+        kings[index] = k
+
+        # a jump keeps the same side on move until the chain runs out of jumps
+        starts_chain = is_capture & (chain[index] == _ZERO)
+        chain_man[index[starts_chain]] = ~was_king[starts_chain]
+        chain[index] = np.where(is_capture, landing, _ZERO)
+
+        simple = ~is_capture
+        black_to_move[index[simple]] = ~btm[simple]
+        plies[index[simple]] += 1
+        quiet[index] = np.where(simple & was_king, quiet[index] + 1, 0)
+
+
+def _legal_actions(occupied, own, opp, kings, black_to_move) -> Tuple[np.ndarray, np.ndarray]:
+    occupied, own, opp, kings = occupied[:, None], own[:, None], opp[:, None], kings[:, None]
+
+    from_own = (own & _SOURCES) != _ZERO
+    from_king = (kings & _SOURCES) != _ZERO
+    landing_free = (occupied & _LANDINGS) == _ZERO
+    in_between = occupied & _BETWEEN
+    opp_between = opp & _BETWEEN
+    man_forward = ~from_king & np.where(black_to_move[:, None], _BLACK_FORWARD, _WHITE_FORWARD)
+
+    simple = from_own & landing_free & (in_between == _ZERO) & (from_king | man_forward & (_DISTANCES == 1))
+
+    single_opponent = (opp_between != _ZERO) & ((opp_between & (opp_between - _ONE)) == _ZERO)
+    capture = (from_own & landing_free & single_opponent & (in_between == opp_between)
+               & (from_king | man_forward & (_DISTANCES == 2)))
+    return simple, capture
@@ -0,0 +1,246 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from bitboard_state import BitboardGameState
+from bot import Bot
+from custom_types import Board, Coord, PlayerTileClaim, PlayerType
+from game_state import GameState
+from match import play_game
+from mtcs_engine import MCTS, MCTSNode, SearchMode, _reachable
+from rollout_policy import POLICIES, make_policy
+
+logger = logging.getLogger(__name__)
+
+# fixed positions as (black men, black kings, white men, white kings, player to move)
+Position = Tuple[List[Coord], List[Coord], List[Coord], List[Coord], PlayerType]
+
+POSITIONS: Dict[str, Position] = {
+    'opening': (
+        [(r, c) for r in range(3) for c in range(8) if (r + c) % 2 == 1], [],
+        [(r, c) for r in range(5, 8) for c in range(8) if (r + c) % 2 == 1], [],
+        PlayerType.BLACK,
+    ),
+    'midgame': (
+        [(0, 7), (1, 0), (1, 2), (1, 6), (2, 1), (2, 5), (3, 2), (3, 6)], [],
+        [(4, 3), (5, 0), (5, 4), (5, 6), (6, 1), (6, 5), (6, 7), (7, 2)], [],
+        PlayerType.WHITE,
+    ),
+    'king_endgame': (
+        [(2, 1)], [(0, 1), (4, 5)],
+        [(6, 3)], [(7, 6), (3, 0), (5, 2)],
+        PlayerType.BLACK,
+    ),
+}
+
+ENGINES: Dict[str, Callable] = {
+    'game_state': GameState,
+    'bitboard': BitboardGameState,
+}
+
+
+def make_state(name: str, engine: str = 'bitboard'):
+    black_men, black_kings, white_men, white_kings, player = POSITIONS[name]
+    tiles = [[PlayerTileClaim() for _ in range(8)] for __ in range(8)]
+    for color, men, kings in ((PlayerType.BLACK, black_men, black_kings), (PlayerType.WHITE, white_men, white_kings)):
+        for row, col in men:
+            tiles[row][col] = PlayerTileClaim(is_set=True, color=color)
+        for row, col in kings:
+            tiles[row][col] = PlayerTileClaim(is_set=True, color=color, is_king=True)
+    return ENGINES[engine](Board(tiles), player)
+
+
+def bench_move_generation(repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for engine in ENGINES:
+        results[engine] = {}
+        for name in POSITIONS:
+            state = make_state(name, engine)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                # drop the cached list so every call really generates
+                state._moves = None
+                state.try_generate_moves()
+            elapsed = time.perf_counter() - start
+            results[engine][name] = repeat / elapsed
+    return results
+
+
+def bench_rollouts(count: int, seed: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for engine in ENGINES:
+        results[engine] = {}
+        for name in POSITIONS:
+            rng = random.Random(seed)
+            state = make_state(name, engine)
+            node = MCTSNode(state)
+            start = time.perf_counter()
+            for _ in range(count):
+                node.simulate(state, rng=rng)
+            results[engine][name] = count / (time.perf_counter() - start)
+    return results
+
+
+def bench_policies(policies: List[str], count: int, seed: int) -> Dict[str, Dict[str, float]]:
+    # rollouts per second of each policy on the bitboard engine
+    results = {}
+    for spec in policies:
+        policy = make_policy(spec)
+        results[spec] = {}
+        for name in POSITIONS:
+            rng = random.Random(seed)
+            state = make_state(name)
+            node = MCTSNode(state)
+            start = time.perf_counter()
+            for _ in range(count):
+                node.simulate(state, policy=policy, rng=rng)
+            results[spec][name] = count / (time.perf_counter() - start)
+    return results
+
+
+def bench_search(modes: List[SearchMode], iterations: int, workers: int | None, seed: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for mode in modes:
+        mcts = MCTS(time_limit=float('inf'), iter_limit=iterations, mode=mode, workers=workers, reuse_tree=False, 
+                    seed=seed, iterations_only=True)
+        try:
+            start = time.perf_counter()
+            for snapshot in mcts.search_iter(make_state('opening')):
+                pass
+            elapsed = time.perf_counter() - start
+        finally:
+            mcts.close()
+        # early stopping may end the search before the iteration limit
+        results[mode.value] = {
+            'iterations': snapshot.iterations, 'iterations_per_sec': snapshot.iterations / elapsed, 
+            'seconds': elapsed, 'best_move': snapshot.best_move, 'win_rate': snapshot.win_rate,
+        }
+    return results
+
+
+def bench_node_memory(iterations: int, seed: int) -> Dict[str, float]:
+    mcts = MCTS(time_limit=float('inf'), iter_limit=iterations, seed=seed, iterations_only=True)
+    state = make_state('opening')
+
+    tracemalloc.start()
+    try:
+        mcts.search(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    nodes = len(_reachable(mcts._root))
+    return {'nodes': nodes, 'peak_bytes': peak, 'peak_bytes_per_node': peak / nodes}
+
+
+def bench_strength(games: int, candidate: Dict, baseline: Dict, max_plies: int, seed: int) -> Dict[str, float]:
+    # each bot draws from its own seeded generator for the whole series
+    candidate_bot, baseline_bot = Bot(**{'seed': seed, **candidate}), Bot(**{'seed': seed + 1, **baseline})
+    wins = draws = losses = 0
+    try:
+        for game in range(games):
+            # alternate colours so neither side keeps the first move
+            candidate_color = PlayerType.BLACK if game % 2 == 0 else PlayerType.WHITE
+            if candidate_color == PlayerType.BLACK:
+                result = play_game(candidate_bot, baseline_bot, max_plies=max_plies)
+            else:
+                result = play_game(baseline_bot, candidate_bot, max_plies=max_plies)
+
+            if result.winner is None:
+                draws += 1
+            elif result.winner == candidate_color:
+                wins += 1
+            else:
+                losses += 1
+            logger.info(f"game {game + 1}/{games}: winner={result.winner}, plies={result.plies}")
+    finally:
+        candidate_bot.close()
+        baseline_bot.close()
+
+    return {
+        'games': games, 'wins': wins, 'draws': draws, 'losses': losses,
+        'score': (wins + 0.5 * draws) / games if games else 0.0,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> Dict:
+    modes = [SearchMode(mode) for mode in args.modes]
+    candidate = {'time_limit': float('inf'), 'iter_limit': args.candidate_iterations, 'mode': SearchMode(args.candidate_mode), 'workers': args.workers,
+                 'rollout_policy': args.candidate_policy, 'selection': args.candidate_selection, 'widening': args.candidate_widening}
+    baseline = {'time_limit': float('inf'), 'iter_limit': args.baseline_iterations, 'rollout_policy': args.baseline_policy}
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'seed': args.seed,
+    }
+    logger.info("benchmark: move generation")
+    report['move_generation_per_sec'] = bench_move_generation(args.movegen_repeat)
+    logger.info("benchmark: rollouts")
+    report['rollouts_per_sec'] = bench_rollouts(args.rollouts, args.seed)
+    logger.info("benchmark: rollout policies")
+    report['policy_rollouts_per_sec'] = bench_policies(args.policies, args.rollouts, args.seed)
+    logger.info("benchmark: search")
+    report['search'] = bench_search(modes, args.iterations, args.workers, args.seed)
+    logger.info("benchmark: node memory")
+    report['memory'] = bench_node_memory(args.iterations, args.seed)
+    if args.games:
+        logger.info("benchmark: strength")
+        report['strength'] = {
+            'candidate': {**candidate, 'mode': candidate['mode'].value, 'time_limit': None},
+            'baseline': {**baseline, 'time_limit': None},
+            **bench_strength(args.games, candidate, baseline, args.max_plies, args.seed),
+        }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark move generation, rollouts, MCTS search and playing strength.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--movegen-repeat', type=int, default=2000)
+    parser.add_argument('--rollouts', type=int, default=200)
+    parser.add_argument('--policies', nargs='+', default=list(POLICIES), help="rollout policies to time, e.g. uniform evaluation:30")
+    parser.add_argument('--iterations', type=int, default=2000, help="MCTS iterations per search")
+    parser.add_argument('--modes', nargs='+', default=[SearchMode.SEQUENTIAL.value], choices=[mode.value for mode in SearchMode])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--games', type=int, default=0, help="games against the baseline, 0 skips the strength test")
+    parser.add_argument('--candidate-mode', default=SearchMode.SEQUENTIAL.value, choices=[mode.value for mode in SearchMode])
+    parser.add_argument('--candidate-iterations', type=int, default=1000)
+    parser.add_argument('--candidate-policy', default='uniform', help="rollout policy of the candidate bot")
+    parser.add_argument('--candidate-selection', default='uct', choices=['uct', 'ucb1_tuned'])
+    parser.add_argument('--candidate-widening', type=float, default=None, help="progressive widening constant of the candidate bot")
+    parser.add_argument('--baseline-iterations', type=int, default=200)
+    parser.add_argument('--baseline-policy', default='uniform')
+    parser.add_argument('--max-plies', type=int, default=200)
+    parser.add_argument('--output', default=None, help="JSON file, stdout if not given")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    logger.setLevel(logging.INFO)
+    args = parse_args()
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+    else:
+        print(report)
@@ -0,0 +1,458 @@
+from typing import List, NamedTuple, Tuple
+import logging
+
+from custom_types import (DRAW_QUIET_PLIES, DRAW_REPETITIONS, SQUARE_COORDS, GameStatus, Move, PlayerType, PlayerTileClaim, Board,
+                          board_masks, masks_board, pack_position, position_from_fen, position_to_fen, unpack_position)
+from zobrist import PIECE_KEYS, WHITE_TO_MOVE_KEY, hash_masks
+
+logger = logging.getLogger(__name__)
+
+# COORD_SQUARES[row][col] maps a dark tile back to its square, light tiles are -1
+COORD_SQUARES: List[List[int]] = [[-1] * 8 for _ in range(8)]
+for _sq, (_row, _col) in enumerate(SQUARE_COORDS):
+    COORD_SQUARES[_row][_col] = _sq
+
+FULL_MASK = (1 << 32) - 1
+ROW_MASKS: List[int] = [0b1111 << (4 * row) for row in range(8)]
+
+# same order as GameState._get_directions: black men use 0-1, white men 2-3, kings all
+DIRECTIONS: List[Tuple[int, int]] = [(1, -1), (1, 1), (-1, -1), (-1, 1)]
+KING_DIRS = (0, 1, 2, 3)
+BLACK_DIRS, WHITE_DIRS = (0, 1), (2, 3)
+MAN_DIRS = {PlayerType.BLACK: BLACK_DIRS, PlayerType.WHITE: WHITE_DIRS}
+BLACK_PROMOTION, WHITE_PROMOTION = ROW_MASKS[7], ROW_MASKS[0]
+
+
+def _build_rays() -> List[List[Tuple[int, ...]]]:
+    rays = []
+    for row, col in SQUARE_COORDS:
+        square_rays = []
+        for dir_row, dir_col in DIRECTIONS:
+            ray = []
+            next_row, next_col = row + dir_row, col + dir_col
+            while 0 <= next_row < 8 and 0 <= next_col < 8:
+                ray.append(COORD_SQUARES[next_row][next_col])
+                next_row += dir_row
+                next_col += dir_col
+            square_rays.append(tuple(ray))
+        rays.append(square_rays)
+    return rays
+
+
+# RAYS[sq][d] lists the squares met when sliding from sq in direction d
+RAYS = _build_rays()
+
+
+def _build_between() -> List[List[int]]:
+    between = [[0] * 32 for _ in range(32)]
+    for sq in range(32):
+        for ray in RAYS[sq]:
+            mask = 0
+            for target in ray:
+                between[sq][target] = mask
+                mask |= 1 << target
+    return between
+
+
+# BETWEEN[a][b] is the mask of squares strictly between two squares on one diagonal
+BETWEEN = _build_between()
+
+
+def _build_man_steps(player: PlayerType) -> List[Tuple[int, int]]:
+    # one (source mask, square distance) pair per direction and row parity, so every
+    # man of a colour can be stepped with a single shift; black men shift up, white down
+    steps = {}
+    for sq in range(32):
+        for d in MAN_DIRS[player]:
+            ray = RAYS[sq][d]
+            if ray:
+                delta = abs(ray[0] - sq)
+                steps[delta] = steps.get(delta, 0) | 1 << sq
+    return [(mask, delta) for delta, mask in steps.items()]
+
+
+def _build_man_jumps(player: PlayerType) -> List[Tuple[int, int, int]]:
+    # (source mask, distance to the jumped square, distance to the landing square)
+    jumps = {}
+    for sq in range(32):
+        for d in MAN_DIRS[player]:
+            ray = RAYS[sq][d]
+            if len(ray) >= 2:
+                key = (abs(ray[0] - sq), abs(ray[1] - sq))
+                jumps[key] = jumps.get(key, 0) | 1 << sq
+    return [(mask, over, land) for (over, land), mask in jumps.items()]
+
+
+BLACK_STEPS = _build_man_steps(PlayerType.BLACK)
+WHITE_STEPS = _build_man_steps(PlayerType.WHITE)
+BLACK_JUMPS = _build_man_jumps(PlayerType.BLACK)
+WHITE_JUMPS = _build_man_jumps(PlayerType.WHITE)
+
+INITIAL_BLACK = ROW_MASKS[0] | ROW_MASKS[1] | ROW_MASKS[2]
+INITIAL_WHITE = ROW_MASKS[5] | ROW_MASKS[6] | ROW_MASKS[7]
+INITIAL_ZOBRIST = hash_masks(INITIAL_BLACK, INITIAL_WHITE, 0, PlayerType.BLACK)
+
+BLACK_KEYS = PIECE_KEYS[PlayerType.BLACK]
+WHITE_KEYS = PIECE_KEYS[PlayerType.WHITE]
+
+
+def _capture_dfs(square: int,
+                 is_king: bool,
+                 man_dirs: Tuple[int, ...],
+                 promotion_mask: int,
+                 occupied: int,
+                 opponents: int,
+                 path: List[int],
+                 result_possible_moves: List[Move]):
+    # mirrors GameState._dfs: jumped pieces leave the board straight away and a man
+    # reaching the last row keeps capturing as a king
+    found_capture = False
+
+    for d in (KING_DIRS if is_king else man_dirs):
+        ray = RAYS[square][d]
+        length = len(ray)
+        i = 0
+        if is_king:
+            while i < length and not occupied >> ray[i] & 1:
+                i += 1
+        if i >= length - 1:
+            continue
+
+        victim_bit = 1 << ray[i]
+        if not opponents & victim_bit:
+            continue
+
+        for landing in ray[i + 1:]:
+            if occupied >> landing & 1:
+                break
+
+            found_capture = True
+            path.append(landing)
+            _capture_dfs(landing,
+                         is_king or bool(promotion_mask >> landing & 1),
+                         man_dirs,
+                         promotion_mask,
+                         occupied & ~victim_bit,
+                         opponents & ~victim_bit,
+                         path,
+                         result_possible_moves)
+            path.pop()
+
+            if not is_king:
+                break
+
+    if not found_capture and len(path) > 1:
+        result_possible_moves.append([SQUARE_COORDS[sq] for sq in path])
+
+
+class BitboardUndo(NamedTuple):
+    origin: int
+    target: int
+    captured: int
+    captured_kings: int
+    promoted: bool
+    player: PlayerType
+    zobrist: int
+    quiet_plies: int
+
+
+class BitboardGameState:
+    __slots__ = ('black', 'white', 'kings', 'player', 'zobrist', 'quiet_plies', 'history', '_board', '_moves')
+
+    def __init__(self, board: Board | None = None, player_to_move=PlayerType.BLACK):
+        self.player = player_to_move
+        self._board: Board | None = None
+        self._moves: List[Move] | None = None
+        # see GameState: plies since the last capture or man move, hashes before each move
+        self.quiet_plies = 0
+        self.history: List[int] = []
+
+        if board is None:
+            self.black, self.white, self.kings = INITIAL_BLACK, INITIAL_WHITE, 0
+            self.zobrist = INITIAL_ZOBRIST if player_to_move == PlayerType.BLACK else INITIAL_ZOBRIST ^ WHITE_TO_MOVE_KEY
+            return
+
+        self.black, self.white, self.kings = board_masks(board)
+        self.zobrist = hash_masks(self.black, self.white, self.kings, self.player)
+
+    @classmethod
+    def from_masks(cls, black: int, white: int, kings: int, player_to_move=PlayerType.BLACK, zobrist: int | None = None):
+        state = cls.__new__(cls)
+        state.black, state.white, state.kings = black, white, kings
+        state.player = player_to_move
+        state.zobrist = hash_masks(black, white, kings, player_to_move) if zobrist is None else zobrist
+        state._board = None
+        state._moves = None
+        state.quiet_plies = 0
+        state.history = []
+        return state
+
+    @classmethod
+    def from_game_state(cls, state):
+        converted = cls(state.board, state.player)
+        converted.quiet_plies = state.quiet_plies
+        converted.history = state.history_window()
+        return converted
+
+    @classmethod
+    def from_bytes(cls, data: bytes, history: List[int] | None = None):
+        black, white, kings, player, quiet_plies = unpack_position(data)
+        state = cls.from_masks(black, white, kings, player)
+        state.quiet_plies = quiet_plies
+        state.history = list(history or [])
+        return state
+
+    @classmethod
+    def from_fen(cls, text: str):
+        return cls.from_masks(*position_from_fen(text))
+
+    def to_bytes(self) -> bytes:
+        return pack_position(self.black, self.white, self.kings, self.player, self.quiet_plies)
+
+    def to_fen(self) -> str:
+        return position_to_fen(self.black, self.white, self.kings, self.player)
+
+    def position_masks(self) -> Tuple[int, int, int]:
+        return self.black, self.white, self.kings
+
+    def history_window(self) -> List[int]:
+        return self.history[max(len(self.history) - self.quiet_plies, 0):]
+
+    def __hash__(self) -> int:
+        return self.zobrist
+
+    def __eq__(self, other) -> bool:
+        # see GameState.__eq__
+        if not hasattr(other, 'position_masks'):
+            return NotImplemented
+        return self.zobrist == other.zobrist and self.player == other.player and self.position_masks() == other.position_masks()
+
+    def __reduce__(self):
+        return self.__class__.from_bytes, (self.to_bytes(), self.history_window())
+
+    @property
+    def board(self) -> Board:
+        # read-only grid view for the UI, rebuilt lazily after each move
+        if self._board is None:
+            self._board = masks_board(self.black, self.white, self.kings)
+        return self._board
+
+    def copy(self):
+        state = BitboardGameState.from_masks(self.black, self.white, self.kings, self.player, self.zobrist)
+        state.quiet_plies = self.quiet_plies
+        state.history = self.history_window()
+        return state
+
+    def position_key(self) -> Tuple[int, int, int, PlayerType]:
+        return self.black, self.white, self.kings, self.player
+
+    def is_inside_board(self, row: int, col: int) -> bool:
+        return 0 <= row < 8 and 0 <= col < 8
+
+    def opponent(self, player: PlayerType | None = None) -> PlayerType:
+        if player is None:
+            player = self.player
+        return PlayerType.WHITE if player == PlayerType.BLACK else PlayerType.BLACK
+
+    def try_generate_moves(self) -> List[Move]:
+        # cached until the position changes, callers must not modify the returned list
+        moves = self._moves
+        if moves is None:
+            is_black = self.player is PlayerType.BLACK
+            moves = self._generate_captures(is_black) or self._generate_simple_moves(is_black)
+            self._moves = moves
+        return moves
+
+    def status(self) -> GameStatus:
+        if not self.black:
+            return GameStatus([], PlayerType.WHITE, True)
+
+        if not self.white:
+            return GameStatus([], PlayerType.BLACK, True)
+
+        if self.is_draw():
+            return GameStatus([], None, True)
+
+        moves = self.try_generate_moves()
+        if not moves:
+            return GameStatus(moves, self.opponent(self.player), True)
+
+        return GameStatus(moves, None, False)
+
+    def is_draw(self) -> bool:
+        quiet_plies = self.quiet_plies
+        if quiet_plies >= DRAW_QUIET_PLIES:
+            return True
+        if quiet_plies < 4:
+            return False
+        history, zobrist = self.history, self.zobrist
+        repetitions = 1
+        oldest = max(len(history) - quiet_plies, 0)
+        for index in range(len(history) - 2, oldest - 1, -2):
+            if history[index] == zobrist:
+                repetitions += 1
+                if repetitions >= DRAW_REPETITIONS:
+                    return True
+        return False
+
+    def piece_count(self, player: PlayerType) -> int:
+        return (self.black if player == PlayerType.BLACK else self.white).bit_count()
+
+    def king_count(self, player: PlayerType) -> int:
+        return ((self.black if player == PlayerType.BLACK else self.white) & self.kings).bit_count()
+
+    def tile(self, row: int, col: int) -> PlayerTileClaim:
+        # single square lookup without building the board view, light squares are always empty
+        square = COORD_SQUARES[row][col]
+        if square < 0:
+            return PlayerTileClaim()
+        bit = 1 << square
+        if not (self.black | self.white) & bit:
+            return PlayerTileClaim()
+        color = PlayerType.BLACK if self.black & bit else PlayerType.WHITE
+        return PlayerTileClaim(is_set=True, color=color, is_king=bool(self.kings & bit))
+
+    def apply_move(self, move: Move) -> BitboardUndo:
+        row, col = move[0]
+        origin = square = COORD_SQUARES[row][col]
+        piece_bit = 1 << square
+        is_king = self.kings & piece_bit
+
+        player = self.player
+        is_black = player is PlayerType.BLACK
+        if is_black:
+            own, opponents = self.black, self.white
+        else:
+            own, opponents = self.white, self.black
+
+        own &= ~piece_bit
+        kings = self.kings & ~piece_bit
+        captured = 0
+
+        for (next_row, next_col) in move[1:]:
+            next_square = COORD_SQUARES[next_row][next_col]
+            if abs(next_row - row) > 1:
+                captured |= BETWEEN[square][next_square] & opponents
+            row, square = next_row, next_square
+
+        captured_kings = kings & captured
+        opponent_captured = captured
+        opponents &= ~captured
+        kings &= ~captured
+
+        piece_bit = 1 << square
+        own |= piece_bit
+        promoted = not is_king and (BLACK_PROMOTION if is_black else WHITE_PROMOTION) & piece_bit
+        if is_king or promoted:
+            kings |= piece_bit
+
+        own_keys, opponent_keys = (BLACK_KEYS, WHITE_KEYS) if is_black else (WHITE_KEYS, BLACK_KEYS)
+        zobrist = self.zobrist ^ WHITE_TO_MOVE_KEY ^ own_keys[bool(is_king)][origin] ^ own_keys[bool(is_king or promoted)][square]
+        while captured:
+            low = captured & -captured
+            zobrist ^= opponent_keys[bool(captured_kings & low)][low.bit_length() - 1]
+            captured ^= low
+
+        if is_black:
+            self.black, self.white = own, opponents
+            self.player = PlayerType.WHITE
+        else:
+            self.white, self.black = own, opponents
+            self.player = PlayerType.BLACK
+        self.kings = kings
+        self._board = None
+        self._moves = None
+        undo = BitboardUndo(origin, square, opponent_captured, captured_kings, bool(promoted), player, self.zobrist, self.quiet_plies)
+        self.history.append(self.zobrist)
+        self.quiet_plies = self.quiet_plies + 1 if is_king and not opponent_captured else 0
+        self.zobrist = zobrist
+        return undo
+
+    def unmake_move(self, undo: BitboardUndo):
+        origin_bit = 1 << undo.origin
+        target_bit = 1 << undo.target
+
+        kings = self.kings
+        was_king = kings & target_bit and not undo.promoted
+        kings &= ~target_bit
+        if was_king:
+            kings |= origin_bit
+        self.kings = kings | undo.captured_kings
+
+        if undo.player is PlayerType.BLACK:
+            self.black = self.black & ~target_bit | origin_bit
+            self.white |= undo.captured
+        else:
+            self.white = self.white & ~target_bit | origin_bit
+            self.black |= undo.captured
+        self.player = undo.player
+        self.zobrist = undo.zobrist
+        self.quiet_plies = undo.quiet_plies
+        self.history.pop()
+        self._board = None
+        self._moves = None
+
+    def winner(self) -> PlayerType | None:
+        return self.status().winner
+
+    def _generate_captures(self, is_black: bool) -> List[Move]:
+        empty = ~(self.black | self.white) & FULL_MASK
+
+        # kings may capture from afar, men only next to an opponent with an empty tile behind it
+        if is_black:
+            own, opponents, man_dirs, promotion_mask = self.black, self.white, BLACK_DIRS, BLACK_PROMOTION
+            men = own & ~self.kings
+            jumpers = own & self.kings
+            for source_mask, over, land in BLACK_JUMPS:
+                jumpers |= men & source_mask & (opponents >> over) & (empty >> land)
+        else:
+            own, opponents, man_dirs, promotion_mask = self.white, self.black, WHITE_DIRS, WHITE_PROMOTION
+            men = own & ~self.kings
+            jumpers = own & self.kings
+            for source_mask, over, land in WHITE_JUMPS:
+                jumpers |= men & source_mask & (opponents << over) & (empty << land)
+
+        possible_moves: List[Move] = []
+        occupied = self.black | self.white
+        kings = self.kings
+
+        while jumpers:
+            low = jumpers & -jumpers
+            square = low.bit_length() - 1
+            _capture_dfs(square, bool(kings & low), man_dirs, promotion_mask,
+                         occupied & ~low, opponents, [square], possible_moves)
+            jumpers ^= low
+
+        return possible_moves
+
+    def _generate_simple_moves(self, is_black: bool) -> List[Move]:
+        empty = ~(self.black | self.white) & FULL_MASK
+        own = self.black if is_black else self.white
+        men = own & ~self.kings
+        possible_moves: List[Move] = []
+
+        for source_mask, delta in (BLACK_STEPS if is_black else WHITE_STEPS):
+            if is_black:
+                targets = (men & source_mask) << delta & empty
+            else:
+                targets = (men & source_mask) >> delta & empty
+                delta = -delta
+            while targets:
+                low = targets & -targets
+                target = low.bit_length() - 1
+                possible_moves.append([SQUARE_COORDS[target - delta], SQUARE_COORDS[target]])
+                targets ^= low
+
+        kings = own & self.kings
+        while kings:
+            low = kings & -kings
+            square = low.bit_length() - 1
+            origin = SQUARE_COORDS[square]
+            for ray in RAYS[square]:
+                for target in ray:
+                    if not empty >> target & 1:
+                        break
+                    possible_moves.append([origin, SQUARE_COORDS[target]])
+            kings ^= low
+
+        return possible_moves
@@ -1,11 +1,111 @@
+import logging
+import threading
+from typing import Any, Callable, Dict
+
 from game_state import GameState
+from bitboard_state import BitboardGameState
 from custom_types import Move
-from mtcs_engine import MCTS
+from mtcs_engine import MCTS, RootStat, SearchMode, SearchSnapshot
+from opening_book import OpeningBook, open_book
+from telemetry import open_telemetry
+
+logger = logging.getLogger(__name__)
 
 
 class Bot:
-    def __init__(self):
-        self.mcts = MCTS(time_limit=1.0, iter_limit=1000)
+    def __init__(self, 
+                 time_limit: float = 1.0,
+                 iter_limit: int = 1000,
+                 use_bitboard: bool = True, 
+                 mode: SearchMode = SearchMode.SEQUENTIAL, 
+                 workers: int | None = None, 
+                 leaf_batch: int | None = None,
+                 reuse_tree: bool = True,
+                 table_size: int | None = None,
+                 batch_size: int | None = None,
+                 stop_share: float | None = None,
+                 tablebase: str | None = None,
+                 rollout_policy: str = 'uniform',
+                 book: str | None = None,
+                 telemetry: str | None = None,
+                 telemetry_prometheus: str | None = None,
+                 selection: str = 'uct',
+                 widening: float | None = None,
+                 seed: int | None = None,
+                 iterations_only: bool = False):
+        self.mcts = MCTS(time_limit=time_limit, iter_limit=iter_limit, mode=mode, workers=workers, leaf_batch=leaf_batch, 
+                         reuse_tree=reuse_tree, table_size=table_size, batch_size=batch_size,
+                         stop_share=stop_share, tablebase=tablebase, rollout_policy=rollout_policy,
+                         telemetry=open_telemetry(telemetry, telemetry_prometheus) if telemetry else None,
+                         selection=selection, widening=widening, seed=seed, iterations_only=iterations_only)
+        self.use_bitboard = use_bitboard
+        self.book: OpeningBook | None = open_book(book) if book else None
+
+    def get_move(self, game_state: GameState, stop: threading.Event | None = None) -> Move | None:
+        snapshot = self.think(game_state, stop)
+        return snapshot.best_move if snapshot is not None else None
+
+    def think(self, game_state: GameState, stop: threading.Event | None = None) -> SearchSnapshot | None:
+        # the final search snapshot, with the visit distribution behind the chosen move
+        state = self._search_state(game_state)
+        entry = self.book.lookup(state) if self.book is not None else None
+        if entry is not None:
+            logger.info(f"book move: {entry.move}, win_rate={entry.win_rate:.3f}")
+            return SearchSnapshot(0, 0.0, entry.move, [RootStat(entry.move, 0, 0.0)], entry.win_rate)
+        
+        snapshot = None
+        for snapshot in self.mcts.search_iter(state, stop):
+            pass
+        return snapshot
+
+    def ponder(self, game_state: GameState, stop: threading.Event):
+        # search on the opponent's turn until `stop` is set, see MCTS.ponder
+        self.mcts.ponder(self._search_state(game_state), stop)
+
+    def close(self):
+        self.mcts.close()
+
+    def _search_state(self, game_state: GameState) -> GameState:
+        if self.use_bitboard and not isinstance(game_state, BitboardGameState):
+            # search on the bitboard engine, the returned move is valid for both representations
+            return BitboardGameState.from_game_state(game_state)
+        return game_state
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+_CONFIG_TYPES: Dict[str, Callable[[str], Any]] = {
+    'time_limit': float,
+    'iter_limit': int,
+    'use_bitboard': _parse_bool,
+    'mode': SearchMode,
+    'workers': int,
+    'leaf_batch': int,
+    'reuse_tree': _parse_bool,
+    'table_size': int,
+    'batch_size': int,
+    'stop_share': float,
+    'tablebase': str,
+    'rollout_policy': str,
+    'book': str,
+    'telemetry': str,
+    'telemetry_prometheus': str,
+    'selection': str,
+    'widening': float,
+    'seed': int,
+    'iterations_only': _parse_bool,
+}
+
 
-    def get_move(self, game_state: GameState) -> Move | None:
-        return self.mcts.search(game_state)
\ No newline at end of file
+def parse_bot_config(spec: str) -> Dict[str, Any]:
+    # "iter_limit=400,mode=tree_parallel" -> Bot keyword arguments, for command line tools
+    config = {}
+    for item in filter(None, spec.split(',')):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key not in _CONFIG_TYPES:
+            raise ValueError(f"unknown bot option: {key}")
+        config[key] = _CONFIG_TYPES[key](value.strip())
+    return config
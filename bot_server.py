@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Deque, Dict, List, NamedTuple, Tuple
+
+from bitboard_state import BitboardGameState
+from bot import Bot, parse_bot_config
+from custom_types import Move, PlayerType
+
+logger = logging.getLogger(__name__)
+
+# Line protocol, one JSON object per line in each direction. A request names its game
+# and gives the position either as the moves played from the initial position (which
+# also carries the repetition history), as bitboard masks or as text (see position_to_fen):
+#   {"id": 7, "game": "g1", "moves": [[[2, 1], [3, 0]], ...], "time_limit": 0.5}
+#   {"id": 8, "game": "g2", "position": {"black": 4095, "white": 4293918720, "kings": 0, "player": "black"}}
+#   {"id": 9, "game": "g3", "fen": "W:W18,K30:B1,2,3"}
+#   {"id": 10, "game": "g1", "close": true}
+# Replies echo the id: {"id": 7, "game": "g1", "move": [[5, 0], [4, 1]], "win_rate": 0.52,
+# "iterations": 800, "elapsed": 0.49}, or {"id": 7, "error": "..."}. A finished game gets no
+# search: {"id": 7, "game": "g1", "move": null, "winner": "black"}, winner null for a draw.
+
+_MAX_GAMES = 256 # trees kept per worker process, the least recently used game is dropped
+
+# per worker process: the bot configuration and one bot (so one tree) per game
+_CONFIG: Dict[str, Any] = {}
+_BOTS: 'OrderedDict[str, Bot]' = OrderedDict()
+
+
+def _init_worker(config: Dict[str, Any]):
+    _CONFIG.update(config)
+
+
+def _decode_moves(moves: List) -> List[Move]:
+    return [[(row, col) for row, col in move] for move in moves]
+
+
+def _request_state(request: Dict[str, Any]) -> BitboardGameState:
+    if 'fen' in request:
+        return BitboardGameState.from_fen(request['fen'])
+    if 'position' in request:
+        position = request['position']
+        black, white, kings = (_mask(position, key) for key in ('black', 'white', 'kings'))
+        if black & white:
+            raise ValueError(f"a square holds two pieces in {position}")
+        if kings & ~(black | white):
+            raise ValueError(f"a king on an empty square in {position}")
+        return BitboardGameState.from_masks(black, white, kings, PlayerType(position['player']))
+
+    state = BitboardGameState()
+    for move in _decode_moves(request.get('moves', [])):
+        if move not in state.try_generate_moves():
+            raise ValueError(f"illegal move {move}")
+        state.apply_move(move)
+    return state
+
+
+def _mask(position: Dict[str, Any], key: str) -> int:
+    mask = position[key]
+    if not isinstance(mask, int) or not 0 <= mask < 1 << 32:
+        raise ValueError(f"bad {key} mask {mask!r}, expected an int of 32 bits")
+    return mask
+
+
+def _serve_move(game: str, request: Dict[str, Any], time_limit: float, iter_limit: int) -> Dict[str, Any]:
+    # runs in the game's worker process, its bot keeps the tree between requests
+    bot = _BOTS.pop(game, None) or Bot(**_CONFIG)
+    _BOTS[game] = bot
+    if len(_BOTS) > _MAX_GAMES:
+        _, evicted = _BOTS.popitem(last=False)
+        evicted.close()
+
+    state = _request_state(request)
+    status = state.status()
+    if status.is_over:
+        return _game_over(status.winner)
+    bot.mcts.time_limit, bot.mcts.iter_limit = time_limit, iter_limit
+    snapshot = bot.think(state)
+    if snapshot is None:
+        return _game_over(state.status().winner)
+    return {'move': snapshot.best_move, 'win_rate': snapshot.win_rate,
+            'iterations': snapshot.iterations, 'elapsed': snapshot.elapsed}
+
+
+def _game_over(winner: PlayerType | None) -> Dict[str, Any]:
+    return {'move': None, 'winner': winner.value if winner is not None else None}
+
+
+def _close_game(game: str) -> Dict[str, Any]:
+    bot = _BOTS.pop(game, None)
+    if bot is not None:
+        bot.close()
+    return {'closed': bot is not None}
+
+
+def _serve_batch(calls: List[Tuple[str, Dict[str, Any], float, int]]) -> List[Tuple[Dict[str, Any] | None, Exception | None]]:
+    # several requests in one executor call, each answered or failed on its own
+    results = []
+    for game, request, time_limit, iter_limit in calls:
+        try:
+            if request.get('close'):
+                result = _close_game(game)
+            else:
+                result = _serve_move(game, request, time_limit, iter_limit)
+        except Exception as error:
+            results.append((None, error))
+        else:
+            results.append((result, None))
+    return results
+
+
+class _Job(NamedTuple):
+    game: str
+    request: Dict[str, Any]
+    time_limit: float
+    iter_limit: int
+    reply: asyncio.Future
+
+
+class _Shard:
+    """One single-process executor and the games pinned to it, served round-robin."""
+
+    def __init__(self, server: 'BotServer', config: Dict[str, Any]):
+        self.server = server
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(config,))
+        self.queues: Dict[str, Deque[_Job]] = {}
+        self.turns: Deque[str] = deque() # games with queued requests, next one first
+        self.wakeup = asyncio.Event()
+
+    def submit(self, job: _Job):
+        queue = self.queues.get(job.game)
+        if queue is None:
+            queue = self.queues[job.game] = deque()
+            self.turns.append(job.game)
+        queue.append(job)
+        self.wakeup.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self.turns:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+
+            jobs = self._next_batch()
+            calls = [(job.game, job.request, job.time_limit, job.iter_limit) for job in jobs]
+            try:
+                results = await loop.run_in_executor(self.executor, _serve_batch, calls)
+            except Exception as error:
+                # the worker process itself failed
+                for job in jobs:
+                    job.reply.set_exception(error)
+                continue
+            for job, (result, error) in zip(jobs, results):
+                if error is not None:
+                    job.reply.set_exception(error)
+                else:
+                    job.reply.set_result(result)
+
+    def _next_batch(self) -> List[_Job]:
+        # one request per game and turn, so a game sending many requests can't hold up the
+        # others. Requests go to the worker together while their time budgets add up to
+        # little, which saves a round trip per cheap request without delaying a real search.
+        server = self.server
+        jobs: List[_Job] = []
+        budget = 0.0
+        while self.turns and len(jobs) < server._MAX_BATCH:
+            game = self.turns[0]
+            queue = self.queues[game]
+            cost = 0.0 if queue[0].request.get('close') else queue[0].time_limit
+            if jobs and budget + cost > server._BATCH_SECONDS:
+                break
+            self.turns.popleft()
+            jobs.append(queue.popleft())
+            budget += cost
+            if queue:
+                self.turns.append(game)
+            else:
+                del self.queues[game]
+        return jobs
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+class BotServer:
+    """Serves moves for many concurrent games over a JSON line protocol.
+
+    Each game is pinned to one of `workers` single-process shards, so its tree stays in
+    the process that built it and is reused by the next request for that game.
+    """
+
+    _TIME_LIMIT = 1.0 # seconds per move when a request gives no budget
+    _MAX_TIME = 10.0
+    _ITER_LIMIT = 1000000 # the time budget is what normally ends a search
+    _MAX_BATCH = 32 # requests sent to a worker in one call
+    _BATCH_SECONDS = 0.05 # combined time budget of the requests batched into one call
+
+    def __init__(self, workers: int | None = None, config: Dict[str, Any] | None = None,
+                 time_limit: float | None = None, max_time: float | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.config = config or {}
+        self.time_limit = time_limit or self._TIME_LIMIT
+        self.max_time = max_time or self._MAX_TIME
+        self._shards: List[_Shard] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def limits(self, request: Dict[str, Any]) -> Tuple[float, int]:
+        # the request's time and iteration budget, bounded by the server's
+        time_limit = float(request.get('time_limit', self.time_limit))
+        if not 0 < time_limit < math.inf:
+            raise ValueError(f"bad time_limit {time_limit}, expected a positive number of seconds")
+        time_limit = min(time_limit, self.max_time)
+        iter_limit = int(request.get('iter_limit') or self.config.get('iter_limit') or self._ITER_LIMIT)
+        if iter_limit < 0:
+            raise ValueError(f"bad iter_limit {iter_limit}")
+        return time_limit, iter_limit
+
+    def start(self):
+        # needs the running event loop
+        self._shards = [_Shard(self, self.config) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(shard.run()) for shard in self._shards]
+
+    async def request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if 'game' not in request:
+            raise ValueError("request without a game")
+        game = str(request['game'])
+        time_limit, iter_limit = self.limits(request)
+        reply = asyncio.get_running_loop().create_future()
+        self._shards[hash(game) % len(self._shards)].submit(_Job(game, request, time_limit, iter_limit, reply))
+        return {'game': game, **await reply}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while line := await reader.readline():
+                # answered as they finish, a slow game doesn't hold up the rest of the connection
+                task = asyncio.create_task(self._answer(line, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            writer.close()
+
+    async def _answer(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        request_id = None
+        start = time.time()
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            reply = await self.request(request)
+        except Exception as error:
+            logger.warning(f"request {request_id} failed: {error!r}")
+            reply = {'error': str(error)}
+        else:
+            logger.debug(f"request {request_id} for game {reply['game']} answered in {time.time() - start:.3f}s")
+
+        async with write_lock:
+            writer.write(json.dumps({'id': request_id, **reply}).encode() + b'\n')
+            await writer.drain()
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for shard in self._shards:
+            shard.close()
+
+
+async def serve(server: BotServer, unix: str | None = None, host: str = '127.0.0.1', port: int = 8765):
+    server.start()
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=unix)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+    logger.info(f"serving on {unix or f'{host}:{port}'} with {server.workers} workers")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    logger.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description="Serve bot moves for many concurrent games over JSON lines.")
+    parser.add_argument('--unix', default=None, help="unix socket path, TCP is used if not given")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--bot', default='', help="bot configuration such as 'iter_limit=2000,book=book.bin'")
+    parser.add_argument('--time-limit', type=float, default=None, help="seconds per move when a request gives none")
+    parser.add_argument('--max-time', type=float, default=None, help="upper bound on a request's time budget")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(BotServer(args.workers, parse_bot_config(args.bot), args.time_limit, args.max_time),
+                          args.unix, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -1,16 +1,51 @@
+import struct
 from dataclasses import dataclass
-from typing import Tuple, List
+from typing import Tuple, List, NamedTuple
 from enum import Enum
 
 
 Coord = Tuple[int,int]
 Move = List[Coord]
 
+# Only the 32 dark tiles ((row + col) % 2 == 1) are playable. Square `sq` lives on
+# row sq // 4; even rows use the odd columns and odd rows use the even ones.
+SQUARE_COORDS: List[Coord] = [(sq // 4, 2 * (sq % 4) + 1 - (sq // 4) % 2) for sq in range(32)]
+
+
+# draw rules as in international draughts: the same position with the same side to
+# move for the third time, or 25 moves each of only king moves without a capture
+DRAW_REPETITIONS = 3
+DRAW_QUIET_PLIES = 50
+
+
+def encode_move(move: Move) -> int:
+    # the number of squares in the low 4 bits, then 5 bits per square
+    code = len(move)
+    shift = 4
+    for row, col in move:
+        code |= (row * 4 + col // 2) << shift
+        shift += 5
+    return code
+
+
+def decode_move(code: int) -> Move:
+    move = []
+    squares = code >> 4
+    for _ in range(code & 0xF):
+        move.append(SQUARE_COORDS[squares & 31])
+        squares >>= 5
+    return move
+
 
 class PlayerType(Enum):
     WHITE = 'white'
     BLACK = 'black'
 
+class GameStatus(NamedTuple):
+    moves: List[Move]
+    winner: 'PlayerType | None'
+    is_over: bool
+
 @dataclass
 class PlayerTileClaim():
     is_set: bool = False
@@ -50,4 +85,77 @@ class Board:
         return board
     
     def _color_row(self, row: int, color: PlayerType) -> List[PlayerTileClaim]:
-        return [PlayerTileClaim(is_set=True, color=color) if (row + col) % 2 == 1 else PlayerTileClaim() for col in range(8)]
\ No newline at end of file
+        return [PlayerTileClaim(is_set=True, color=color) if (row + col) % 2 == 1 else PlayerTileClaim() for col in range(8)]
+
+
+# Packed position: the black, white and king masks over the 32 dark squares (uint32
+# each, bit `sq` for square `sq`), then one byte with the side to move in bit 0 (set
+# for white) and the plies since the last capture or man move above it. 13 bytes.
+_PACKED_POSITION = struct.Struct('<IIIB')
+
+
+def pack_position(black: int, white: int, kings: int, player: PlayerType, quiet_plies: int = 0) -> bytes:
+    return _PACKED_POSITION.pack(black, white, kings, min(quiet_plies, 127) << 1 | (player == PlayerType.WHITE))
+
+
+def unpack_position(data: bytes) -> Tuple[int, int, int, PlayerType, int]:
+    black, white, kings, flags = _PACKED_POSITION.unpack(data)
+    return black, white, kings, PlayerType.WHITE if flags & 1 else PlayerType.BLACK, flags >> 1
+
+
+def board_masks(board: Board) -> Tuple[int, int, int]:
+    black = white = kings = 0
+    for sq, (row, col) in enumerate(SQUARE_COORDS):
+        tile = board.tiles[row][col]
+        if not tile.is_set:
+            continue
+        if tile.color == PlayerType.BLACK:
+            black |= 1 << sq
+        else:
+            white |= 1 << sq
+        if tile.is_king:
+            kings |= 1 << sq
+    return black, white, kings
+
+
+def masks_board(black: int, white: int, kings: int) -> Board:
+    tiles = [[PlayerTileClaim() for _ in range(8)] for __ in range(8)]
+    for sq, (row, col) in enumerate(SQUARE_COORDS):
+        bit = 1 << sq
+        if (black | white) & bit:
+            color = PlayerType.BLACK if black & bit else PlayerType.WHITE
+            tiles[row][col] = PlayerTileClaim(is_set=True, color=color, is_king=bool(kings & bit))
+    return Board(tiles)
+
+
+def position_to_fen(black: int, white: int, kings: int, player: PlayerType) -> str:
+    # PDN style: side to move, then each side's squares numbered 1-32 (square sq + 1),
+    # kings prefixed with K, e.g. "W:W18,K30:B1,2,3". Black starts on squares 1-12.
+    def squares(mask: int) -> str:
+        return ','.join(('K' if kings >> sq & 1 else '') + str(sq + 1) for sq in range(32) if mask >> sq & 1)
+    side = 'W' if player == PlayerType.WHITE else 'B'
+    return f"{side}:W{squares(white)}:B{squares(black)}"
+
+
+def position_from_fen(text: str) -> Tuple[int, int, int, PlayerType]:
+    fields = [field.strip() for field in text.strip().split(':')]
+    if len(fields) != 3 or fields[0] not in ('B', 'W'):
+        raise ValueError(f"bad position text: {text!r}")
+    masks = {'B': 0, 'W': 0}
+    kings = 0
+    for field in fields[1:]:
+        color, squares = field[:1], field[1:]
+        if color not in masks:
+            raise ValueError(f"bad position text: {text!r}")
+        for item in filter(None, (item.strip() for item in squares.split(','))):
+            is_king = item.startswith('K')
+            number = int(item[1:] if is_king else item)
+            if not 1 <= number <= 32:
+                raise ValueError(f"bad square {number} in {text!r}")
+            masks[color] |= 1 << (number - 1)
+            if is_king:
+                kings |= 1 << (number - 1)
+    if masks['B'] & masks['W']:
+        raise ValueError(f"a square holds two pieces in {text!r}")
+    player = PlayerType.WHITE if fields[0] == 'W' else PlayerType.BLACK
+    return masks['B'], masks['W'], kings, player
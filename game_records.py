@@ -0,0 +1,195 @@
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import BinaryIO, Iterator, List, NamedTuple, Tuple
+
+from custom_types import Move, PlayerType, decode_move, encode_move
+
+logger = logging.getLogger(__name__)
+
+# File layout: the magic, then records appended one after another. A record is its
+# payload length (uint32) followed by the payload:
+#   winner (uint8: 0 none, 1 black, 2 white), seed (uint64),
+#   black and white bot names (uint8 length + utf-8),
+#   ply count (varint), then per ply: move code (varint, see encode_move),
+#   win rate of the side to move (float32), number of root moves (varint)
+#   and a (move code, visits) varint pair for each of them.
+MAGIC = b'CKGR1'
+_LENGTH = struct.Struct('<I')
+_HEADER = struct.Struct('<BQ')
+_WIN_RATE = struct.Struct('<f')
+
+_WINNER_CODES = {None: 0, PlayerType.BLACK: 1, PlayerType.WHITE: 2}
+_CODE_WINNERS = {code: winner for winner, code in _WINNER_CODES.items()}
+
+
+class GameRecord(NamedTuple):
+    winner: PlayerType | None
+    seed: int
+    black: str
+    white: str
+    moves: List[Move]
+    win_rates: List[float] # the mover's estimate when choosing each move
+    visits: List[List[Tuple[Move, int]]] # root visit distribution for each move
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, offset: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _write_name(out: bytearray, name: str):
+    encoded = name.encode()[:255]
+    out.append(len(encoded))
+    out += encoded
+
+
+def encode_record(record: GameRecord) -> bytes:
+    payload = bytearray(_HEADER.pack(_WINNER_CODES[record.winner], record.seed))
+    _write_name(payload, record.black)
+    _write_name(payload, record.white)
+    _write_varint(payload, len(record.moves))
+    for move, win_rate, visits in zip(record.moves, record.win_rates, record.visits):
+        _write_varint(payload, encode_move(move))
+        payload += _WIN_RATE.pack(win_rate)
+        _write_varint(payload, len(visits))
+        for visit_move, count in visits:
+            _write_varint(payload, encode_move(visit_move))
+            _write_varint(payload, count)
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def decode_record(data, offset: int = 0) -> Tuple[GameRecord, int]:
+    # decodes the record starting at `offset`, returns it with the offset of the next one
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    end = offset + length
+
+    winner_code, seed = _HEADER.unpack_from(data, offset)
+    offset += _HEADER.size
+    names = []
+    for _ in range(2):
+        name_length = data[offset]
+        names.append(bytes(data[offset + 1:offset + 1 + name_length]).decode())
+        offset += 1 + name_length
+
+    plies, offset = _read_varint(data, offset)
+    moves, win_rates, visits = [], [], []
+    for _ in range(plies):
+        code, offset = _read_varint(data, offset)
+        moves.append(decode_move(code))
+        win_rates.append(_WIN_RATE.unpack_from(data, offset)[0])
+        offset += _WIN_RATE.size
+        count, offset = _read_varint(data, offset)
+        distribution = []
+        for _ in range(count):
+            code, offset = _read_varint(data, offset)
+            move_visits, offset = _read_varint(data, offset)
+            distribution.append((decode_move(code), move_visits))
+        visits.append(distribution)
+
+    record = GameRecord(_CODE_WINNERS[winner_code], seed, names[0], names[1], moves, win_rates, visits)
+    return record, end
+
+
+def _complete_end(file: BinaryIO, size: int) -> int:
+    # offset just past the last complete record, 0 if not even the magic is complete
+    if size < len(MAGIC):
+        return 0
+    file.seek(0)
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{file.name} is not a game record file")
+
+    offset = len(MAGIC)
+    while offset + _LENGTH.size <= size:
+        file.seek(offset)
+        (length,) = _LENGTH.unpack(file.read(_LENGTH.size))
+        if offset + _LENGTH.size + length > size:
+            break
+        offset += _LENGTH.size + length
+    return offset
+
+
+class RecordWriter:
+    """Appends game records to a file, flushing every few records or seconds."""
+
+    _FLUSH_EVERY = 50 # records
+    _FLUSH_SECONDS = 5.0
+
+    def __init__(self, path: str, flush_every: int | None = None, flush_seconds: float | None = None):
+        self.path = path
+        self.flush_every = flush_every or self._FLUSH_EVERY
+        self.flush_seconds = flush_seconds or self._FLUSH_SECONDS
+        self._file: BinaryIO = open(path, 'a+b')
+        # a record cut short by a crash would hide every record appended after it
+        size = self._file.seek(0, os.SEEK_END)
+        end = _complete_end(self._file, size)
+        if end < size:
+            logger.warning(f"{path}: dropping {size - end} bytes of an incomplete record at offset {end}")
+            self._file.truncate(end)
+        if end == 0:
+            self._file.write(MAGIC)
+        self._pending = 0
+        self._last_flush = time.time()
+        self.written = 0
+
+    def write(self, record: GameRecord):
+        self._file.write(encode_record(record))
+        self._pending += 1
+        self.written += 1
+        if self._pending >= self.flush_every or time.time() - self._last_flush > self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        logger.debug(f"flushed {self._pending} records to {self.path}")
+        self._pending = 0
+        self._last_flush = time.time()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_records(path: str) -> Iterator[GameRecord]:
+    # decodes one record at a time from a memory map, so files larger than memory are fine.
+    # A record cut short by a crash mid-write ends the iteration.
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a game record file")
+
+            offset = len(MAGIC)
+            size = len(data)
+            while offset + _LENGTH.size <= size:
+                (length,) = _LENGTH.unpack_from(data, offset)
+                if offset + _LENGTH.size + length > size:
+                    logger.warning(f"{path}: incomplete record at offset {offset}, stopping")
+                    return
+                record, offset = decode_record(data, offset)
+                yield record
@@ -1,18 +1,119 @@
 import copy
-from typing import List, Set, Tuple
+from typing import List, NamedTuple, Tuple
 import logging
 
-from custom_types import Move, PlayerType, PlayerTileClaim, Board
+from custom_types import (DRAW_QUIET_PLIES, DRAW_REPETITIONS, Coord, GameStatus, Move, PlayerType, PlayerTileClaim, Board,
+                          board_masks, masks_board, pack_position, position_from_fen, position_to_fen, unpack_position)
+from zobrist import WHITE_TO_MOVE_KEY, hash_board, piece_key
 
 logger = logging.getLogger(__name__)
-    
+
+
+class MoveUndo(NamedTuple):
+    origin: Coord
+    piece: PlayerTileClaim
+    target: Coord
+    captured: List[Tuple[Coord, PlayerTileClaim]]
+    promoted: bool
+    player: PlayerType
+    zobrist: int
+    quiet_plies: int
+
+
+# _RAYS[row][col][d] lists the tiles met when sliding from (row, col) in direction d,
+# each as (row, col, bit of the tile in a row * 8 + col mask)
+_DIRECTIONS = [(1,-1),(1,1),(-1,-1),(-1,1)]
+_RAYS = [
+    [
+        [
+            tuple((row + dir_row*k, col + dir_col*k, 1 << ((row + dir_row*k) * 8 + col + dir_col*k)) for k in range(1, 8)
+                  if 0 <= row + dir_row*k < 8 and 0 <= col + dir_col*k < 8)
+            for dir_row, dir_col in _DIRECTIONS
+        ]
+        for col in range(8)
+    ]
+    for row in range(8)
+]
+_KING_DIRS = (0, 1, 2, 3)
+_BLACK_MAN_DIRS = (0, 1)
+_WHITE_MAN_DIRS = (2, 3)
+_MAX_CHAIN = 13 # origin plus at most 12 captured pieces
+
+
+class _CaptureStack:
+    # saved frames of the capture search, allocated once per GameState
+    def __init__(self):
+        self.path: List[Coord] = [(0, 0)] * _MAX_CHAIN
+        self.kings: List[bool] = [False] * _MAX_CHAIN
+        self.direction_index: List[int] = [0] * _MAX_CHAIN
+        self.victims: List[int] = [0] * _MAX_CHAIN
+        self.rays: List[Tuple[Tuple[int, int, int], ...]] = [()] * _MAX_CHAIN
+        self.landing_index: List[int] = [0] * _MAX_CHAIN
+        self.landing_end: List[int] = [0] * _MAX_CHAIN
+        self.found: List[bool] = [False] * _MAX_CHAIN
+
+
 class GameState:
     def __init__(self, board=None, player_to_move=PlayerType.BLACK):
         self.board = board or Board()
         self.player = player_to_move
+        self.zobrist = hash_board(self.board, self.player)
+        self._piece_counts = {player: self._remaining_tiles(player) for player in PlayerType}
+        self._moves: List[Move] | None = None
+        self._capture_stack: _CaptureStack | None = None
+        # plies since the last capture or man move, and the hashes of the positions before
+        # each move played on this state (one per undo record)
+        self.quiet_plies = 0
+        self.history: List[int] = []
 
     def copy(self):
-        return GameState(copy.deepcopy(self.board), self.player)
+        state = GameState(copy.deepcopy(self.board), self.player)
+        state.quiet_plies = self.quiet_plies
+        state.history = self.history_window()
+        return state
+
+    def history_window(self) -> List[int]:
+        # only the positions since the last capture or man move can come back
+        return self.history[max(len(self.history) - self.quiet_plies, 0):]
+
+    def position_key(self) -> Tuple:
+        return tuple((tile.is_set, tile.color, tile.is_king) for _, _, tile in self.board.iter_tiles()) + (self.player,)
+
+    def position_masks(self) -> Tuple[int, int, int]:
+        # black, white and king masks over the 32 dark squares, as in BitboardGameState
+        return board_masks(self.board)
+
+    def to_bytes(self) -> bytes:
+        return pack_position(*self.position_masks(), self.player, self.quiet_plies)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, history: List[int] | None = None):
+        black, white, kings, player, quiet_plies = unpack_position(data)
+        state = cls(masks_board(black, white, kings), player)
+        state.quiet_plies = quiet_plies
+        state.history = list(history or [])
+        return state
+
+    def to_fen(self) -> str:
+        return position_to_fen(*self.position_masks(), self.player)
+
+    @classmethod
+    def from_fen(cls, text: str):
+        black, white, kings, player = position_from_fen(text)
+        return cls(masks_board(black, white, kings), player)
+
+    def __hash__(self) -> int:
+        return self.zobrist
+
+    def __eq__(self, other) -> bool:
+        # same position and side to move, across both engines; the move history is not compared
+        if not hasattr(other, 'position_masks'):
+            return NotImplemented
+        return self.zobrist == other.zobrist and self.player == other.player and self.position_masks() == other.position_masks()
+
+    def __reduce__(self):
+        # pickles as the packed position and the history window instead of the tile objects
+        return self.__class__.from_bytes, (self.to_bytes(), self.history_window())
     
     def is_inside_board(self, row: int, col: int) -> bool:
         return 0 <= row < 8 and 0 <= col < 8
@@ -23,6 +124,55 @@ class GameState:
         return PlayerType.WHITE if player == PlayerType.BLACK else PlayerType.BLACK
 
     def try_generate_moves(self) -> List[Move]:
+        # cached until the position changes, callers must not modify the returned list
+        if self._moves is None:
+            self._moves = self._generate_moves()
+        return self._moves
+
+    def status(self) -> GameStatus:
+        if self._piece_counts[PlayerType.BLACK] == 0:
+            return GameStatus([], PlayerType.WHITE, True)
+        
+        if self._piece_counts[PlayerType.WHITE] == 0:
+            return GameStatus([], PlayerType.BLACK, True)
+        
+        if self.is_draw():
+            return GameStatus([], None, True)
+        
+        moves = self.try_generate_moves()
+        if not moves:
+            return GameStatus(moves, self.opponent(self.player), True)
+        
+        return GameStatus(moves, None, False)
+
+    def is_draw(self) -> bool:
+        quiet_plies = self.quiet_plies
+        if quiet_plies >= DRAW_QUIET_PLIES:
+            return True
+        if quiet_plies < 4:
+            return False
+        # the same side is to move every second ply, nothing before the last capture or man move can repeat
+        history, zobrist = self.history, self.zobrist
+        repetitions = 1
+        # a state restored from bytes knows its quiet plies but not the positions before them
+        oldest = max(len(history) - quiet_plies, 0)
+        for index in range(len(history) - 2, oldest - 1, -2):
+            if history[index] == zobrist:
+                repetitions += 1
+                if repetitions >= DRAW_REPETITIONS:
+                    return True
+        return False
+
+    def piece_count(self, player: PlayerType) -> int:
+        return self._piece_counts[player]
+
+    def king_count(self, player: PlayerType) -> int:
+        return sum(1 for _, _, tile in self.board.iter_player_tiles(player) if tile.is_king)
+
+    def tile(self, row: int, col: int) -> PlayerTileClaim:
+        return self.board.tiles[row][col]
+
+    def _generate_moves(self) -> List[Move]:
         player = self.player
         captures: List[Move] = []
         moves: List[Move] = []
@@ -42,11 +192,13 @@ class GameState:
         
         return moves
         
-    def apply_move(self, move: Move):
+    def apply_move(self, move: Move) -> MoveUndo:
         board = self.board.tiles
         row,col = move[0]
         piece = board[row][col]
         board[row][col] = PlayerTileClaim()
+        captured: List[Tuple[Coord, PlayerTileClaim]] = []
+        zobrist = self.zobrist ^ piece_key(piece.color, piece.is_king, row, col) ^ WHITE_TO_MOVE_KEY
         
         for (next_row,next_col) in move[1:]:
             delta_row = next_row - row
@@ -61,6 +213,9 @@ class GameState:
                 while check_row != next_row:
                     if board[check_row][check_col].is_set:
                         logger.debug(f"capture at {(check_row,check_col)} by move {(row,col)} -> {(next_row,next_col)}")
+                        captured_piece = board[check_row][check_col]
+                        captured.append(((check_row,check_col), captured_piece))
+                        zobrist ^= piece_key(captured_piece.color, captured_piece.is_king, check_row, check_col)
                         board[check_row][check_col] = PlayerTileClaim()
                         break
 
@@ -69,162 +224,151 @@ class GameState:
                     
             row,col = next_row,next_col
             
-        piece = self._check_promotion(row, piece)
-        piece.is_set = True
-        board[row][col] = piece
+        moved_piece = self._check_promotion(row, piece)
+        moved_piece.is_set = True
+        board[row][col] = moved_piece
+        zobrist ^= piece_key(moved_piece.color, moved_piece.is_king, row, col)
         
+        undo = MoveUndo(move[0], piece, (row,col), captured, moved_piece.is_king and not piece.is_king, self.player, self.zobrist,
+                        self.quiet_plies)
+        self.history.append(self.zobrist)
+        self.quiet_plies = self.quiet_plies + 1 if piece.is_king and not captured else 0
+        self.zobrist = zobrist
         self.player = self.opponent()
+        self._piece_counts[self.player] -= len(captured)
+        self._moves = None
         logger.debug(f"next to move: {self.player}")
+        return undo
+
+    def unmake_move(self, undo: MoveUndo):
+        board = self.board.tiles
+        target_row, target_col = undo.target
+        board[target_row][target_col] = PlayerTileClaim()
         
-    def winner(self) -> PlayerType | None:
-        black_left = self._remaining_tiles(PlayerType.BLACK)
-        white_left = self._remaining_tiles(PlayerType.WHITE)
+        for (row,col), tile in undo.captured:
+            board[row][col] = tile
+            
+        origin_row, origin_col = undo.origin
+        board[origin_row][origin_col] = undo.piece
+        self._piece_counts[self.opponent(undo.player)] += len(undo.captured)
+        self.player = undo.player
+        self.zobrist = undo.zobrist
+        self.quiet_plies = undo.quiet_plies
+        self.history.pop()
+        self._moves = None
         
-        if black_left == 0: 
-            return PlayerType.WHITE
+    def winner(self) -> PlayerType | None:
+        return self.status().winner
+    
+    def _try_capture(self, row: int, col: int) -> List[Move]:
+        # iterative depth-first search over capture chains. A jumped piece leaves the board
+        # straight away (it may be slid over or landed on later in the chain) and a man
+        # reaching the last row continues as a king. The current frame lives in locals,
+        # parent frames are saved on preallocated per-depth stacks, and the path and the
+        # mask of vacated tiles are updated in place.
+        tiles = self.board.tiles
+        piece = tiles[row][col]
+        color = piece.color
+        promotion_row = 7 if color == PlayerType.BLACK else 0
+        man_directions = _BLACK_MAN_DIRS if color == PlayerType.BLACK else _WHITE_MAN_DIRS
         
-        if white_left == 0: 
-            return PlayerType.BLACK
+        if not piece.is_king:
+            # most men can't jump at all, don't set up the search for them
+            for direction in man_directions:
+                ray = _RAYS[row][col][direction]
+                if len(ray) < 2:
+                    continue
+                (victim_row, victim_col, _), (landing_row, landing_col, _) = ray[0], ray[1]
+                victim = tiles[victim_row][victim_col]
+                if victim.is_set and victim.color != color and not tiles[landing_row][landing_col].is_set:
+                    break
+            else:
+                return []
         
-        if not self.try_generate_moves():
-            win = self.opponent(self.player)
-            return win
+        stack = self._capture_stack
+        if stack is None:
+            stack = self._capture_stack = _CaptureStack()
+        path = stack.path
+        saved_kings, saved_directions, saved_victims = stack.kings, stack.direction_index, stack.victims
+        saved_rays, saved_landings, saved_landing_ends, saved_found = stack.rays, stack.landing_index, stack.landing_end, stack.found
+        possible_moves: List[Move] = []
         
-        return None
-    
-    def _dfs(self, 
-             board: Board, 
-             row: int, col: int, 
-             path: List[Tuple[int,int]], 
-             captured: Set[Tuple[int,int]], 
-             result_possible_moves: List[Move]):
+        depth = 0
+        path[0] = (row, col)
+        current_row, current_col = row, col
+        is_king = piece.is_king
+        direction_index = 0
+        ray = ()
+        landing_index = landing_end = 0
+        victim_bit = 0
+        found = False
+        vacated = 1 << (row * 8 + col)
         
-        piece = board.tiles[row][col]
-        if not piece.is_set or piece.color is None:
-            return
-
-        directions = self._get_directions(piece)
-
-        has_capture = self._dfs_captures(
-                board,
-                row,
-                col,
-                directions,
-                piece,
-                path,
-                captured,
-                result_possible_moves,
-                piece.is_king,
-            )
-
-        if not has_capture:
-            result_possible_moves.append(path)
-
-    def _dfs_captures(
-        self,
-        board: Board,
-        row: int,
-        col: int,
-        directions: List[Tuple[int, int]],
-        piece: PlayerTileClaim,
-        path: List[Tuple[int, int]],
-        captured: Set[Tuple[int, int]],
-        result_possible_moves: List[Move],
-        is_king: bool
-    ) -> bool:
-        found_capture = False
-
-        for dir_row, dir_col in directions:
-            step_row, step_col = row + dir_row, col + dir_col
-
-            while self.is_inside_board(step_row, step_col):
-                current_tile = board.tiles[step_row][step_col]
-                if not current_tile.is_set:
-                    if not is_king:
-                        break
-                    
-                    step_row += dir_row
-                    step_col += dir_col
+        while True:
+            if landing_index < landing_end:
+                landing_row, landing_col, _ = ray[landing_index]
+                # a man stops right behind the captured piece, a king may land on any free tile
+                landing_index = landing_index + 1 if is_king else landing_end
+                found = True
+                vacated |= victim_bit
+                
+                saved_kings[depth], saved_directions[depth], saved_victims[depth] = is_king, direction_index, victim_bit
+                saved_rays[depth], saved_landings[depth], saved_landing_ends[depth], saved_found[depth] = ray, landing_index, landing_end, found
+                depth += 1
+                path[depth] = (landing_row, landing_col)
+                current_row, current_col = landing_row, landing_col
+                is_king = is_king or landing_row == promotion_row
+                direction_index = landing_index = landing_end = victim_bit = 0
+                found = False
+                continue
+            
+            # every landing behind this victim is done, put it back
+            if victim_bit:
+                vacated &= ~victim_bit
+                victim_bit = 0
+            
+            directions = _KING_DIRS if is_king else man_directions
+            if direction_index < len(directions):
+                ray = _RAYS[current_row][current_col][directions[direction_index]]
+                direction_index += 1
+                length = len(ray)
+                
+                step = 0
+                if is_king:
+                    while step < length:
+                        step_row, step_col, bit = ray[step]
+                        if tiles[step_row][step_col].is_set and not vacated & bit:
+                            break
+                        step += 1
+                if step >= length - 1:
                     continue
-
-                if current_tile.color == piece.color or (step_row, step_col) in captured:
-                    break
-
-                landing_row, landing_col = step_row + dir_row, step_col + dir_col
-
-                while self.is_inside_board(landing_row, landing_col):
-                    landing_tile = board.tiles[landing_row][landing_col]
-                    if landing_tile.is_set:
-                        break
-
-                    self._apply_capture(
-                        board,
-                        row,
-                        col,
-                        landing_row,
-                        landing_col,
-                        step_row,
-                        step_col,
-                        path,
-                        captured,
-                        result_possible_moves
-                    )
-                    found_capture = True
-                    
-                    if not is_king:
+                
+                step_row, step_col, bit = ray[step]
+                target = tiles[step_row][step_col]
+                if not target.is_set or vacated & bit or target.color == color:
+                    continue
+                
+                end = step + 1
+                while end < length:
+                    landing_row, landing_col, landing_bit = ray[end]
+                    if tiles[landing_row][landing_col].is_set and not vacated & landing_bit:
                         break
-                    
-                    landing_row += dir_row
-                    landing_col += dir_col
-
+                    end += 1
+                victim_bit = bit
+                landing_index, landing_end = step + 1, end
+                continue
+            
+            if not found and depth > 0:
+                possible_moves.append(path[:depth + 1])
+            if depth == 0:
                 break
-
-        return found_capture
-
-    def _apply_capture(
-        self,
-        board: Board,
-        origin_row: int,
-        origin_col: int,
-        landing_row: int,
-        landing_col: int,
-        capture_row: int,
-        capture_col: int,
-        path: List[Tuple[int, int]],
-        captured: Set[Tuple[int, int]],
-        result_possible_moves: List[Move],
-    ):
-        origin_tile = board.tiles[origin_row][origin_col]
-        captured_tile = board.tiles[capture_row][capture_col]
-        landing_original = board.tiles[landing_row][landing_col]
-
-        board.tiles[origin_row][origin_col] = PlayerTileClaim()
-        board.tiles[capture_row][capture_col] = PlayerTileClaim()
-
-        moved_piece = PlayerTileClaim(is_set=True, color=origin_tile.color, is_king=origin_tile.is_king)
-        moved_piece = self._check_promotion(landing_row, moved_piece)
-        board.tiles[landing_row][landing_col] = moved_piece
-
-        new_captured = captured | {(capture_row, capture_col)}
-        self._dfs(board, landing_row, landing_col, path + [(landing_row, landing_col)], new_captured, result_possible_moves)
-
-        board.tiles[landing_row][landing_col] = landing_original
-        board.tiles[capture_row][capture_col] = captured_tile
-        board.tiles[origin_row][origin_col] = origin_tile
-
-    def _can_be_captured(self, row: int, 
-                         col: int, 
-                         captured: Set[Tuple[int,int]], 
-                         target_piece: PlayerTileClaim, 
-                         landing: PlayerTileClaim, 
-                         attacker_color: PlayerType | None) -> bool:
+            
+            depth -= 1
+            current_row, current_col = path[depth]
+            is_king, direction_index, victim_bit = saved_kings[depth], saved_directions[depth], saved_victims[depth]
+            ray, landing_index, landing_end, found = saved_rays[depth], saved_landings[depth], saved_landing_ends[depth], saved_found[depth]
         
-        return (target_piece.is_set
-                and target_piece.color != attacker_color
-                and attacker_color is not None
-                and not landing.is_set 
-                and (row,col) not in captured
-        )
+        return possible_moves
                     
     def _get_directions(self, piece: PlayerTileClaim) -> List[Tuple[int,int]]:
         if piece.is_king:
@@ -253,13 +397,6 @@ class GameState:
                  
         return possible_moves
 
-    def _try_capture(self, row: int, col: int) -> List[Move]:
-        possible_moves: List[Move] = []
-        self._dfs(self.board, row,col, [(row,col)], set(), possible_moves)
-        filtered_moves = [m for m in possible_moves if len(m)>=2]
-        return filtered_moves
-    
-        
     def _check_promotion(self, row: int, piece: PlayerTileClaim) -> PlayerTileClaim:
         if piece.color == PlayerType.BLACK and row == 7:
             return PlayerTileClaim(is_set=True, color=PlayerType.BLACK, is_king=True)
@@ -7,18 +7,21 @@ from ui import CheckersUI
 
 
 class GameLoop:
-    def __init__(self, human_player: PlayerType):
+    def __init__(self, human_player: PlayerType, ponder: bool = False):
         self.root = tk.Tk()
         self.root.title("Checkers with MCTS")
-        self.ui = CheckersUI(self.root, GameState(), human_player)
+        self.ui = CheckersUI(self.root, GameState(), human_player, ponder)
         
     def run(self):
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self.ui.close()
         
     def stop(self):
         self.root.quit()
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
-    loop = GameLoop(human_player=PlayerType.WHITE)
+    loop = GameLoop(human_player=PlayerType.WHITE, ponder=True)
     loop.run()
\ No newline at end of file
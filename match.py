@@ -0,0 +1,41 @@
+import logging
+from typing import List, NamedTuple
+
+from bitboard_state import BitboardGameState
+from bot import Bot
+from custom_types import Move, PlayerType
+from game_state import GameState
+from mtcs_engine import SearchSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class GameResult(NamedTuple):
+    winner: PlayerType | None
+    plies: int
+    moves: List[Move]
+    snapshots: List[SearchSnapshot] # the search behind each move
+
+
+def play_game(black: Bot, white: Bot, state: GameState | None = None, max_plies: int = 200) -> GameResult:
+    # headless bot vs bot game, a game still running after max_plies counts as a draw
+    state = state or BitboardGameState()
+    bots = {PlayerType.BLACK: black, PlayerType.WHITE: white}
+    moves: List[Move] = []
+    snapshots: List[SearchSnapshot] = []
+    
+    while len(moves) < max_plies:
+        status = state.status()
+        if status.is_over:
+            logger.info(f"game finished after {len(moves)} plies, winner: {status.winner}")
+            return GameResult(status.winner, len(moves), moves, snapshots)
+        
+        snapshot = bots[state.player].think(state)
+        if snapshot is None or snapshot.best_move is None:
+            break
+        state.apply_move(snapshot.best_move)
+        moves.append(snapshot.best_move)
+        snapshots.append(snapshot)
+        
+    logger.info(f"game stopped after {len(moves)} plies without a winner")
+    return GameResult(None, len(moves), moves, snapshots)
@@ -1,150 +1,793 @@
 from __future__ import annotations
+import os
 import random
 import math
 import time
 import logging
-from typing import List, NamedTuple
-from custom_types import PlayerType, Move
+import threading
+from concurrent.futures import FIRST_EXCEPTION, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from enum import Enum
+from typing import Dict, Iterator, List, NamedTuple, Sequence, Set, Tuple
+from custom_types import PlayerType, Move, decode_move, encode_move
 from game_state import GameState
+from rollout_policy import RolloutPolicy, UniformPolicy, make_policy
+from telemetry import SearchProfile, Telemetry, TimedState, tree_shape
+from tablebase import Tablebase, open_tablebase
+from transposition import TranspositionTable
 
 logger = logging.getLogger(__name__)
 
 
-class Choice(NamedTuple):
-    uct: float
-    node: MCTSNode  
+# one int object per distinct move code, shared by every node that stores the move
+_MOVE_CODES: Dict[int, int] = {}
+
+
+def _pack_move(move: Move) -> int:
+    code = encode_move(move)
+    return _MOVE_CODES.setdefault(code, code)
+
+
+class RootStat(NamedTuple):
+    move: Move
+    visits: int
+    wins: float
+
+
+class SearchSnapshot(NamedTuple):
+    iterations: int
+    elapsed: float
+    best_move: Move | None
+    stats: List[RootStat] # visit distribution over the root moves
+    win_rate: float # value of the best move for the player to move
+
+
+class SearchMode(Enum):
+    SEQUENTIAL = 'sequential'
+    ROOT_PARALLEL = 'root_parallel' # independent trees per worker, root statistics merged
+    LEAF_PARALLEL = 'leaf_parallel' # one tree, a batch of simulations per leaf across workers
+    TREE_PARALLEL = 'tree_parallel' # one shared tree, worker threads spread out by virtual loss
+    BATCH = 'batch' # leaves collected with virtual loss, played out together by the NumPy engine
     
     
+# 1 / sqrt(n) for the edge visit counts selection meets most often
+_INVERSE_SQRT_SIZE = 4096
+_INVERSE_SQRT = [0.0] + [n ** -0.5 for n in range(1, _INVERSE_SQRT_SIZE)]
+
+
 class MCTSNode:
     _MAX_DEPTH = 200 # arbitrary depth limit
     _C_PARAM = math.sqrt(2) # UCT constant
+    _WIDEN_MIN_MOVES = 8 # progressive widening only limits nodes with more moves than this
+    
+    __slots__ = ('mover', 'moves', 'children', 'child_visits', 'visits', 'wins')
     
-    def __init__(self, state: GameState, parent=None, move=None):
-        self.state = state
-        self.parent = parent
-        self.move = move
-        self.children: List[MCTSNode] = []
+    # nodes don't keep a GameState: the search walks one mutable state down the tree
+    # and rewinds it with the undo records returned by apply_move. With a transposition
+    # table a node can have several parents, so moves and edge visits live in the parent.
+    def __init__(self, state: GameState):
+        self.mover = state.opponent()
+        # legal moves packed by encode_move, generated when first needed and shuffled.
+        # Expansion takes them in order, so moves[i] leads to children[i].
+        self.moves: Tuple[int, ...] | None = None
+        # leaves share the empty tuple, the lists are created by the first expansion
+        self.children: Sequence[MCTSNode] = ()
+        self.child_visits: Sequence[int] = ()
         self.visits: int = 0
-        self.wins: float = 0.0
-        self.available_moves: List[Move] = state.try_generate_moves()
+        # stays a small cached int until the first draw makes it a float
+        self.wins: float = 0
 
-    def select(self):
-        choices: List[Choice] = []
+    def select(self) -> int:
+        # Upper Confidence Bounds applied for Trees (UCT) introduced by Kocsis and Szepesvári (2006)
+        # on a DAG: the value comes from the shared child, exploration from this edge's visits
+        # (Childs, Brodeur and Kocsis, 2008). c * sqrt(ln N) is computed once per node and
+        # 1 / sqrt(n) mostly comes from a table, so each child costs a division and a lookup.
+        exploration = self._C_PARAM * math.sqrt(math.log(self.visits))
+        inverse_sqrt = _INVERSE_SQRT
+        child_visits = self.child_visits
+        best_index, best_uct = 0, -math.inf
         
+        index = 0
         for child in self.children:
-            if child.visits==0:
-                uct = float('inf')
-            else:
-                uct = self._upper_confidence_tree(child)
-            
-            choice = Choice(uct,child)
-            choices.append(choice)
-            
-        # return the child with the highest upper confidence bound
-        return max(choices, key=lambda choice: choice.uct).node
+            edge_visits = child_visits[index]
+            if not edge_visits or not child.visits:
+                return index
+            uct = child.wins / child.visits + exploration * (
+                inverse_sqrt[edge_visits] if edge_visits < _INVERSE_SQRT_SIZE else edge_visits ** -0.5)
+            if uct > best_uct:
+                best_index, best_uct = index, uct
+            index += 1
+                
+        return best_index
     
-    def expand(self):
-        random_index = random.randrange(len(self.available_moves))
-        move = self.available_moves.pop(random_index)
+    def select_tuned(self) -> int:
+        # UCB1-Tuned (Auer, Cesa-Bianchi and Fischer, 2002): exploration scaled by an upper
+        # confidence bound on the child's reward variance, capped at 1/4. Rewards are 0, 1/2
+        # or 1, so q(1 - q) stands in for the sample variance.
+        log_visits = math.log(self.visits)
+        child_visits = self.child_visits
+        best_index, best_score = 0, -math.inf
         
-        next_state = self.state.copy()
-        next_state.apply_move(move)
+        index = 0
+        for child in self.children:
+            edge_visits = child_visits[index]
+            if not edge_visits or not child.visits:
+                return index
+            value = child.wins / child.visits
+            log_ratio = log_visits / edge_visits
+            variance = value - value * value + math.sqrt(2 * log_ratio)
+            score = value + math.sqrt(log_ratio * (variance if variance < 0.25 else 0.25))
+            if score > best_score:
+                best_index, best_score = index, score
+            index += 1
+                
+        return best_index
+    
+    def expand(self, state: GameState, table: TranspositionTable[MCTSNode] | None = None):
+        undo = state.apply_move(decode_move(self.moves[len(self.children)]))
         
-        child = MCTSNode(next_state, parent=self, move=move)
+        if table is None:
+            child = MCTSNode(state)
+        else:
+            child = table.get_or_create(state.zobrist, lambda: MCTSNode(state))
+        if not self.children:
+            self.children, self.child_visits = [], [0] * len(self.moves)
         self.children.append(child)
-        return child
+        return child, undo
+
+    def move(self, index: int) -> Move:
+        return decode_move(self.moves[index])
 
+    def child_stats(self) -> List[RootStat]:
+        # a shared child's value, scaled to the visits that went through this edge
+        return [
+            RootStat(self.move(index), visits, child.wins / child.visits * visits if child.visits else 0.0)
+            for index, (child, visits) in enumerate(zip(self.children, self.child_visits))
+        ]
     
-    def is_fully_expanded(self):
-        return len(self.available_moves) == 0
+    def is_fully_expanded(self, state: GameState, widening: float | None = None, rng: random.Random | None = None) -> bool:
+        # `state` must be this node's position, its moves are only generated on the first call
+        moves = self.moves
+        if moves is None:
+            moves = [_pack_move(move) for move in state.try_generate_moves()]
+            (rng or random).shuffle(moves)
+            moves = self.moves = tuple(moves)
+        if widening is not None and len(moves) > self._WIDEN_MIN_MOVES:
+            # progressive widening: about widening * sqrt(visits) children are open to selection,
+            # so wide king positions deepen before every move has been tried
+            open_moves = max(self._WIDEN_MIN_MOVES, int(widening * math.sqrt(self.visits)))
+            return len(self.children) >= min(open_moves, len(moves))
+        return len(moves) == len(self.children)
 
-    def simulate(self):
-        current_state = self.state.copy()
+    def simulate(self, state: GameState, tablebase: Tablebase | None = None, policy: RolloutPolicy | None = None,
+                 rng: random.Random | None = None):
+        policy = policy or _UNIFORM
+        rng = rng or random
+        max_plies = policy.max_plies
+        undo_stack = []
         depth = 0
         
-        while True:
-            # there is a winner
-            winner = current_state.winner()
-            if winner is not None:
-                return winner
-            
-            # there are no moves
-            moves = current_state.try_generate_moves()
-            if not moves:
-                return current_state.opponent()
-            
-            # apply a move
-            move = self._apply_rollout_policy(moves)
-            current_state.apply_move(move)
-            depth += 1
-            if depth > self._MAX_DEPTH:
-                return None
-            
-    def _upper_confidence_tree(self, child: MCTSNode) -> float:
-        # Upper Confidence Bounds applied for Trees (UCT) introduced by Kocsis and Szepesvári (2006) 
-        log_visits = math.log(self.visits)
-        average_actions_result = child.wins/child.visits
-        return average_actions_result + self._C_PARAM * math.sqrt(log_visits/child.visits)   
-    
-    def _apply_rollout_policy(self, possible_moves: List[Move]):
-        return random.choice(possible_moves)  
+        try:
+            while True:
+                if tablebase is not None:
+                    # an endgame in the table ends the playout with its exact result
+                    probe = tablebase.probe(state)
+                    if probe is not None:
+                        return probe.winner
+                    
+                # one move generation gives both the terminal check and the moves
+                status = state.status()
+                if status.is_over:
+                    return status.winner
+                if max_plies is not None and depth >= max_plies:
+                    return policy.evaluate(state, rng)
+                
+                # apply a move
+                move = policy.choose(state, status.moves, rng)
+                undo_stack.append(state.apply_move(move))
+                depth += 1
+                if depth > self._MAX_DEPTH:
+                    return None
+        finally:
+            # rewind the playout so the caller gets its state back
+            for undo in reversed(undo_stack):
+                state.unmake_move(undo)
     
 
+_UNIFORM = UniformPolicy()
+
+_SELECTIONS = {
+    'uct': MCTSNode.select,
+    'ucb1_tuned': MCTSNode.select_tuned,
+}
+
+
 class MCTS:
     _ITER_LIMIT: int = 10000 # arbitrary iteration limit
     _TIME_LIMIT: float = 1.0 # arbitrary time limit
+    _VIRTUAL_LOSS: int = 3 # visits counted as losses while a thread is below a node
+    _LOCK_STRIPES: int = 64 # node locks are shared by hash to keep nodes lock-free
+    _TABLE_SIZE: int = 200000 # transposition table entries
+    _BATCH_SIZE: int = 256 # leaves per NumPy rollout batch
+    _PONDER_ITER_LIMIT: int = 20000 # keeps a forgotten ponder from growing the tree forever
+    _SNAPSHOT_EVERY: int = 100 # iterations between snapshots and early stopping checks
+    _POLL_SECONDS: float = 0.005 # how often a snapshot checks on the tree parallel threads
+    _MIN_STOP_VISITS: int = 200 # root visits before a visit share is trusted
     
-    def __init__(self, time_limit, iter_limit):
+    def __init__(self, time_limit, iter_limit, 
+                 mode: SearchMode = SearchMode.SEQUENTIAL, 
+                 workers: int | None = None, 
+                 leaf_batch: int | None = None,
+                 reuse_tree: bool = True,
+                 table_size: int | None = None,
+                 batch_size: int | None = None,
+                 stop_share: float | None = None,
+                 tablebase: str | None = None,
+                 rollout_policy: str = 'uniform',
+                 telemetry: Telemetry | None = None,
+                 selection: str = 'uct',
+                 widening: float | None = None,
+                 seed: int | None = None,
+                 iterations_only: bool = False):
         self.time_limit = time_limit or self._TIME_LIMIT
         self.iter_limit = iter_limit or self._ITER_LIMIT
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.leaf_batch = leaf_batch or self.workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._threads: ThreadPoolExecutor | None = None
+        self._locks = [threading.Lock() for _ in range(self._LOCK_STRIPES)]
+        self._iterations_lock = threading.Lock()
+        self.reuse_tree = reuse_tree
+        self._root: MCTSNode | None = None
+        self._root_state: GameState | None = None
+        table_size = self._TABLE_SIZE if table_size is None else table_size
+        self._table: TranspositionTable[MCTSNode] | None = TranspositionTable(table_size) if table_size else None
+        self.batch_size = batch_size or self._BATCH_SIZE
+        self._batch_engine = None
+        self._stop: threading.Event | None = None
+        # stop once the best root move holds this share of the visits, None keeps searching
+        self.stop_share = stop_share
+        self.tablebase_path = tablebase
+        self.tablebase: Tablebase | None = open_tablebase(tablebase) if tablebase else None
+        # kept as the spec string for worker processes, see rollout_policy.make_policy
+        self.rollout_spec = rollout_policy
+        self.rollout_policy = make_policy(rollout_policy)
+        if mode == SearchMode.BATCH and rollout_policy != 'uniform':
+            logger.warning(f"batch rollouts are uniform, rollout policy {rollout_policy} is ignored")
+        if selection not in _SELECTIONS:
+            raise ValueError(f"unknown selection: {selection}")
+        self.selection = selection
+        self._select = _SELECTIONS[selection]
+        # children open to selection grow as widening * sqrt(visits), None expands every move
+        self.widening = widening
+        # all randomness of the search comes from this generator, worker processes and
+        # threads get generators seeded from it
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # ignore the wall clock, a seeded sequential, leaf parallel, root parallel or batch
+        # search then gives the same result on every run
+        self.iterations_only = iterations_only
+        if iterations_only and mode == SearchMode.TREE_PARALLEL:
+            logger.warning("tree parallel searches depend on thread scheduling and are not reproducible")
+        # per search metrics, _grow_tree times its phases while a profile is set
+        self.telemetry = telemetry
+        if telemetry is not None and mode not in (SearchMode.SEQUENTIAL, SearchMode.LEAF_PARALLEL):
+            logger.warning(f"{mode.value} searches record no phase timings, only totals and the tree shape")
+        self._profile: SearchProfile | None = None
+
+    def search(self, initial_state: GameState, stop: threading.Event | None = None):
+        # `stop` ends the search early from another thread, the best move so far is returned
+        snapshot = None
+        for snapshot in self.search_iter(initial_state, stop):
+            pass
+        return snapshot.best_move if snapshot is not None else None
+
+    def search_iter(self, initial_state: GameState, stop: threading.Event | None = None, 
+                    snapshot_every: int | None = None) -> Iterator[SearchSnapshot]:
+        # anytime search: yields a snapshot every `snapshot_every` iterations, the last one
+        # holds the final answer. Breaking out of the loop ends the search.
+        self._stop = stop
+        try:
+            yield from self._search_iter(initial_state, snapshot_every or self._SNAPSHOT_EVERY)
+        finally:
+            self._stop = None
 
-    def search(self, initial_state: GameState):
-        logger.info(f"MCTS search start: player={initial_state.player}, time_limit={self.time_limit}, iter_limit={self.iter_limit}")
+    def ponder(self, initial_state: GameState, stop: threading.Event):
+        # think on the opponent's time: grow the tree from the opponent's position until
+        # `stop` is set, the next search then keeps the subtree of the move actually played
+        if self.mode == SearchMode.ROOT_PARALLEL or not self.reuse_tree:
+            return
         
-        root = MCTSNode(initial_state.copy())
+        logger.info("MCTS ponder start")
+        time_limit, iter_limit = self.time_limit, self.iter_limit
+        self.time_limit, self.iter_limit = math.inf, self._PONDER_ITER_LIMIT
+        try:
+            self.search(initial_state, stop)
+        finally:
+            self.time_limit, self.iter_limit = time_limit, iter_limit
+
+    def _search_iter(self, initial_state: GameState, snapshot_every: int) -> Iterator[SearchSnapshot]:
+        logger.info(f"MCTS search start: player={initial_state.player}, time_limit={self.time_limit}, iter_limit={self.iter_limit}, mode={self.mode.value}")
         start_time = time.time()
-        iterations = 0
         
-        while True:
+        # a finished game (won, or drawn by repetition or the no-progress rule) has no move
+        status = initial_state.status()
+        if status.is_over:
+            return
+        moves = status.moves
+        if len(moves) == 1:
+            logger.info("MCTS forced move, not searching")
+            yield self._forced_move(initial_state, start_time, moves[0], 0.5)
+            return
+        
+        known = self.tablebase.best_move(initial_state) if self.tablebase is not None else None
+        if known is not None:
+            move, probe = known
+            logger.info(f"MCTS tablebase move: {move}, winner={probe.winner}, plies={probe.plies + 1}")
+            win_rate = 0.5 if probe.winner is None else float(probe.winner == initial_state.player)
+            yield self._forced_move(initial_state, start_time, move, win_rate)
+            return
+        
+        if self.mode == SearchMode.ROOT_PARALLEL:
+            # the trees live in the worker processes, there is only the merged result
+            stats, iterations = self._search_root_parallel(initial_state)
+            snapshot = self._snapshot(stats, iterations, start_time)
+            yield snapshot
+        else:
+            profile = self._profile = SearchProfile() if self.telemetry is not None else None
+            copy_start = time.perf_counter()
+            state = initial_state.copy()
+            if profile is not None:
+                profile.copy = time.perf_counter() - copy_start
+            root = self._reuse_subtree(state) or self._new_root(state)
+            iterations = 0
+            chunk = snapshot_every
+            if self.mode == SearchMode.BATCH:
+                # whole batches, a smaller chunk would cap every NumPy batch at its size
+                chunk = -(-snapshot_every // self.batch_size) * self.batch_size
+            # tree parallel threads run for the whole search, snapshots are taken while they work
+            workers: List[Future] = []
+            counter = [0, 0] # iterations started and completed by the threads
+            halt = threading.Event()
+            try:
+                while True:
+                    until = iterations + chunk
+                    if self.mode == SearchMode.TREE_PARALLEL:
+                        if not workers:
+                            workers = self._start_tree_parallel(root, state, start_time, counter, halt)
+                        iterations = self._wait_tree_parallel(workers, counter, until)
+                    elif self.mode == SearchMode.BATCH:
+                        iterations = self._grow_tree_batched(root, state, start_time, iterations, until)
+                    else:
+                        iterations = self._grow_tree(root, state, start_time, iterations, until)
+                        
+                    snapshot = self._snapshot(root.child_stats(), iterations, start_time)
+                    final = self._limits_reached(start_time, counter[0] if workers else iterations) or self._decided(snapshot)
+                    if final and workers:
+                        # the answer waits for the searches still running, their virtual loss
+                        # would skew the visit counts
+                        iterations = self._join_tree_parallel(workers, counter, halt)
+                        snapshot = self._snapshot(root.child_stats(), iterations, start_time)
+                    yield snapshot
+                    if final:
+                        break
+            finally:
+                halt.set()
+                wait(workers)
+                if self.reuse_tree:
+                    self._root, self._root_state = root, state
+            
+        logger.info(f"MCTS search end: iterations={iterations}, best_move={snapshot.best_move}")
+        if self._table is not None and self.mode != SearchMode.ROOT_PARALLEL:
+            logger.info(f"MCTS transposition table: entries={len(self._table)}, hits={self._table.hits}")
+        if self.telemetry is not None:
+            self._record_telemetry(initial_state, snapshot, None if self.mode == SearchMode.ROOT_PARALLEL else root)
+
+    def _record_telemetry(self, initial_state: GameState, snapshot: SearchSnapshot, root: MCTSNode | None):
+        metrics = {
+            'time': time.time(), 'mode': self.mode.value, 'position': initial_state.to_fen(),
+            'iterations': snapshot.iterations, 'elapsed': snapshot.elapsed,
+            'iterations_per_sec': snapshot.iterations / snapshot.elapsed if snapshot.elapsed else 0.0,
+            'best_move': snapshot.best_move, 'win_rate': snapshot.win_rate,
+        }
+        profile, self._profile = self._profile, None
+        if profile is not None:
+            metrics['copy_seconds'] = profile.copy
+        if profile is not None and profile.descents:
+            metrics['phases'] = profile.phases
+            metrics['descent'] = {'mean_depth': profile.descent_depth / profile.descents, 'max_depth': profile.max_descent}
+            metrics['nodes_allocated'] = profile.nodes_allocated
+        if profile is not None and profile.rollouts:
+            metrics['rollout_calls'] = profile.calls
+            metrics['rollouts'] = {
+                'count': profile.rollouts, 'plies': profile.rollout_plies,
+                'mean_plies': profile.rollout_plies / profile.rollouts, 'max_plies': profile.max_rollout,
+            }
+        if root is not None:
+            metrics['tree'] = tree_shape(root)
+            if self._table is not None:
+                metrics['table'] = {'entries': len(self._table), 'hits': self._table.hits}
+        self.telemetry.record(metrics)
+
+    def _forced_move(self, initial_state: GameState, start_time: float, move: Move, win_rate: float) -> SearchSnapshot:
+        # a move known without searching, the tree is still moved along for reuse
+        if self.mode != SearchMode.ROOT_PARALLEL:
+            state = initial_state.copy()
+            root = self._reuse_subtree(state) or self._new_root(state)
+            if self.reuse_tree:
+                self._root, self._root_state = root, state
+        return SearchSnapshot(0, time.time() - start_time, move, [RootStat(move, 0, 0.0)], win_rate)
+
+    def _snapshot(self, stats: List[RootStat], iterations: int, start_time: float) -> SearchSnapshot:
+        if not stats:
+            return SearchSnapshot(iterations, time.time() - start_time, None, stats, 0.5)
+        best = max(stats, key=lambda stat: stat.visits)
+        win_rate = best.wins / best.visits if best.visits else 0.5
+        return SearchSnapshot(iterations, time.time() - start_time, best.move, stats, win_rate)
+
+    def _decided(self, snapshot: SearchSnapshot) -> bool:
+        # stop when the runner-up can't catch up with the best move in the iterations that
+        # are left (estimated from the rate so far for the time limit), or the best move
+        # already has `stop_share` of the root visits
+        visits = sorted((stat.visits for stat in snapshot.stats), reverse=True)
+        if not visits:
+            return False
+        best, runner_up = visits[0], visits[1] if len(visits) > 1 else 0
+        
+        remaining = self.iter_limit - snapshot.iterations if self.iter_limit else math.inf
+        if snapshot.iterations and snapshot.elapsed > 0 and not self.iterations_only:
+            rate = snapshot.iterations / snapshot.elapsed
+            remaining = min(remaining, rate * (self.time_limit - snapshot.elapsed))
+        if best - runner_up > remaining:
+            logger.info(f"MCTS early stop: best move can't be overtaken, visits={best}, runner_up={runner_up}")
+            return True
+        
+        total = sum(visits)
+        if self.stop_share is not None and total >= self._MIN_STOP_VISITS and best >= self.stop_share * total:
+            logger.info(f"MCTS early stop: best move has {best}/{total} visits")
+            return True
+        return False
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        if self._threads is not None:
+            self._threads.shutdown()
+            self._threads = None
+
+    def backpropagate(self, path: List[MCTSNode], edges: List[Tuple[MCTSNode, int]], winner: PlayerType | None):
+        # the tree is a DAG, so statistics follow the path actually walked, not parent links
+        for current_node in path:
+            current_node.visits += 1
+            mover = current_node.mover
+            
+            if winner is None:
+                current_node.wins += 0.5
+            elif winner == mover:   
+                current_node.wins += 1
+                
+        for parent, index in edges:
+            parent.child_visits[index] += 1
+
+    def _new_root(self, state: GameState) -> MCTSNode:
+        if self._table is None:
+            return MCTSNode(state)
+        self._table.clear()
+        return self._table.get_or_create(state.zobrist, lambda: MCTSNode(state))
+
+    def _reuse_subtree(self, state: GameState) -> MCTSNode | None:
+        # look for the new position among the children (our move) and grandchildren
+        # (our move plus the opponent's reply) of the previous root
+        root, root_state = self._root, self._root_state
+        self._root = self._root_state = None
+        if root is None or root_state is None:
+            return None
+        
+        key = state.position_key()
+        found = root if root_state.position_key() == key else None
+        for index, child in enumerate(root.children):
+            if found is not None:
+                break
+            child_undo = root_state.apply_move(root.move(index))
+            if root_state.position_key() == key:
+                found = child
+            for grandchild_index, grandchild in enumerate(child.children):
+                if found is not None:
+                    break
+                grandchild_undo = root_state.apply_move(child.move(grandchild_index))
+                if root_state.position_key() == key:
+                    found = grandchild
+                root_state.unmake_move(grandchild_undo)
+            root_state.unmake_move(child_undo)
+            
+        if found is None:
+            logger.info("MCTS tree reuse: position not in previous tree, starting fresh")
+            return None
+        
+        # the table would keep the rest of the old tree alive, only nodes of the subtree stay shared
+        if self._table is not None:
+            self._table.retain(_reachable(found))
+            logger.info(f"MCTS tree reuse: kept subtree with visits={found.visits}, table entries={len(self._table)}")
+        else:
+            logger.info(f"MCTS tree reuse: kept subtree with visits={found.visits}")
+        return found
+
+    def _grow_tree(self, root: MCTSNode, state: GameState, start_time: float, iterations: int = 0, until: float = math.inf) -> int:
+        # runs from `iterations` until the limits or `until` are reached, returns the new count.
+        # With a profile the phases are timed and local rollouts run on a TimedState.
+        select, widening, rng = self._select, self.widening, self.rng
+        profile = self._profile
+        clock = time.perf_counter if profile is not None else _no_clock
+        rollout_state = TimedState(state, profile) if profile is not None else state
+        undo_stack = []
+        
+        while iterations < until:
             if self._limits_reached(start_time, iterations):
                 break
             
+            started = clock()
             node = root
-            while node.is_fully_expanded() and node.children:
-                node = node.select()
+            path = [root]
+            edges = []
+            # a draw depends on the moves that led here, so it ends this path without
+            # making the node terminal for other paths that share it through the table
+            drawn = state.is_draw()
+            while not drawn and node.is_fully_expanded(state, widening, rng) and node.children:
+                index = select(node)
+                undo_stack.append(state.apply_move(node.move(index)))
+                drawn = state.is_draw()
+                edges.append((node, index))
+                node = node.children[index]
+                if node in path:
+                    # repeated position, simulate from here instead of walking the cycle
+                    break
+                path.append(node)
+            selected = clock()
                 
-            if not node.is_fully_expanded():
-                node = node.expand()
+            allocated = False
+            if not drawn and not node.is_fully_expanded(state, widening, rng):
+                parent = node
+                node, undo = parent.expand(state, self._table)
+                undo_stack.append(undo)
+                edges.append((parent, len(parent.children) - 1))
+                if node not in path:
+                    path.append(node)
+                allocated = node.visits == 0
+            expanded = clock()
+            
+            if self.mode == SearchMode.LEAF_PARALLEL:
+                winners = self._simulate_parallel(state)
+            else:
+                winners = [node.simulate(rollout_state, self.tablebase, self.rollout_policy, rng)]
+            simulated = clock()
                 
-            winner = node.simulate()
-            self.backpropagate(node, winner)
-            iterations += 1
+            for winner in winners:
+                self.backpropagate(path, edges, winner)
+            iterations += len(winners)
             
-        if not root.children:
-            return None
+            while undo_stack:
+                state.unmake_move(undo_stack.pop())
             
-        best = max(root.children, key=lambda child: child.visits)
-        logger.info(f"MCTS search end: iterations={iterations}, best_move={best.move if best else None}")
-        return best.move if best else None
+            if profile is not None:
+                # leaf parallel rollouts run in the worker processes, only their time is known
+                rollout = None if self.mode == SearchMode.LEAF_PARALLEL else rollout_state.take_plies()
+                profile.add_iteration(started, selected, expanded, simulated, clock(), len(edges), allocated, rollout)
+                
+        return iterations
 
-    def backpropagate(self, node: MCTSNode, winner: PlayerType | None):
-        current_node = node
-        while current_node is not None:
-            current_node.visits += 1
-            player = current_node.state.player
-            mover = current_node.state.opponent(player)
+    def _search_root_parallel(self, initial_state: GameState) -> Tuple[List[RootStat], int]:
+        start_time = time.time()
+        futures = [
+            self._executor().submit(_root_parallel_worker, initial_state.copy(), start_time, self.time_limit, self.iter_limit, 
+                                        self.rng.getrandbits(64), self.tablebase_path, self.rollout_spec, self.selection, 
+                                        self.widening, self.iterations_only)
+            for _ in range(self.workers)
+        ]
+        
+        # merge root children of all trees by move
+        merged = {}
+        iterations = 0
+        for future in futures:
+            stats, worker_iterations = future.result()
+            iterations += worker_iterations
+            for stat in stats:
+                key = tuple(stat.move)
+                if key in merged:
+                    previous = merged[key]
+                    stat = RootStat(stat.move, previous.visits + stat.visits, previous.wins + stat.wins)
+                merged[key] = stat
+                
+        return list(merged.values()), iterations
+
+    def _start_tree_parallel(self, root: MCTSNode, state: GameState, start_time: float, counter: List[int], 
+                             halt: threading.Event) -> List[Future]:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers)
+        return [
+            self._threads.submit(self._tree_parallel_worker, root, state.copy(), start_time, counter, halt,
+                                 random.Random(self.rng.getrandbits(64)))
+            for _ in range(self.workers)
+        ]
+
+    def _wait_tree_parallel(self, workers: List[Future], counter: List[int], until: int) -> int:
+        # returns the completed iterations once `until` were started or every thread has
+        # stopped at the limits
+        done = ()
+        while counter[0] < until:
+            done, pending = wait(workers, timeout=self._POLL_SECONDS, return_when=FIRST_EXCEPTION)
+            if not pending:
+                break
+        for future in done:
+            future.result()
+        return counter[1]
+
+    def _join_tree_parallel(self, workers: List[Future], counter: List[int], halt: threading.Event) -> int:
+        # stops the threads after their current iteration, returns the completed iterations
+        halt.set()
+        for future in workers:
+            future.result()
+        return counter[1]
+
+    def _tree_parallel_worker(self, root: MCTSNode, state: GameState, start_time: float, iterations: List[int], 
+                              halt: threading.Event, rng: random.Random):
+        undo_stack = []
+        
+        while True:
+            with self._iterations_lock:
+                if halt.is_set() or self._limits_reached(start_time, iterations[0]):
+                    return
+                iterations[0] += 1
             
-            if winner is None:
-                current_node.wins += 0.5
-            elif winner == mover:   
-                current_node.wins += 1
-                                    
-            current_node = current_node.parent
+            node, path, edges = self._descend_virtual(root, state, undo_stack, rng)
+            winner = node.simulate(state, self.tablebase, self.rollout_policy, rng)
+            self._backpropagate_virtual(path, edges, winner)
+            with self._iterations_lock:
+                iterations[1] += 1
+            
+            while undo_stack:
+                state.unmake_move(undo_stack.pop())
+
+    def _descend_virtual(self, root: MCTSNode, state: GameState, undo_stack: List, 
+                         rng: random.Random) -> Tuple[MCTSNode, List[MCTSNode], List[Tuple[MCTSNode, int]]]:
+        # selection and expansion with virtual loss on the way down, so concurrent
+        # (or batched) descents spread out over the tree instead of piling on one leaf
+        node = root
+        path = [root]
+        edges = []
+        self._add_virtual_loss(node)
+        while not state.is_draw():
+            child = undo = None
+            with self._lock_for(node):
+                expanded = not node.is_fully_expanded(state, self.widening, rng)
+                if expanded:
+                    child, undo = node.expand(state, self._table)
+                    index = len(node.children) - 1
+                elif node.children:
+                    index = self._select(node)
+                    child = node.children[index]
+            if child is None:
+                break
+            if undo is None:
+                undo = state.apply_move(node.move(index))
+                
+            undo_stack.append(undo)
+            # the child's virtual loss goes first: a thread selecting on `node` must never
+            # see visits on this edge while the child it leads to has none
+            repeated = child in path
+            if not repeated:
+                self._add_virtual_loss(child)
+            self._add_virtual_loss(node, index)
+            edges.append((node, index))
+            node = child
+            if repeated:
+                break
+            path.append(node)
+            if expanded:
+                break
+        return node, path, edges
+
+    def _grow_tree_batched(self, root: MCTSNode, state: GameState, start_time: float, iterations: int, until: int) -> int:
+        # NumPy is only needed for this mode
+        from batch_rollout import BatchRollout, state_position
+        
+        if self._batch_engine is None:
+            self._batch_engine = BatchRollout(max_depth=MCTSNode._MAX_DEPTH, seed=self.rng.getrandbits(64))
+        undo_stack = []
+        
+        while iterations < until and not self._limits_reached(start_time, iterations):
+            batch_size = min(self.batch_size, until - iterations)
+            if self.iter_limit:
+                batch_size = min(batch_size, self.iter_limit - iterations)
+            leaves = []
+            positions = []
+            for _ in range(batch_size):
+                _, path, edges = self._descend_virtual(root, state, undo_stack, self.rng)
+                leaves.append((path, edges))
+                positions.append(state_position(state))
+                while undo_stack:
+                    state.unmake_move(undo_stack.pop())
+                    
+            winners = self._batch_engine.simulate(positions)
+            for (path, edges), winner in zip(leaves, winners):
+                self._backpropagate_virtual(path, edges, winner)
+            iterations += batch_size
             
+        return iterations
+
+    def _add_virtual_loss(self, node: MCTSNode, index: int | None = None):
+        with self._lock_for(node):
+            if index is None:
+                node.visits += self._VIRTUAL_LOSS
+            else:
+                node.child_visits[index] += self._VIRTUAL_LOSS
+
+    def _backpropagate_virtual(self, path: List[MCTSNode], edges: List[Tuple[MCTSNode, int]], winner: PlayerType | None):
+        # same as backpropagate, but also takes back the virtual loss added on the way down
+        for current_node in path:
+            with self._lock_for(current_node):
+                current_node.visits += 1 - self._VIRTUAL_LOSS
+                if winner is None:
+                    current_node.wins += 0.5
+                elif winner == current_node.mover:
+                    current_node.wins += 1
+                    
+        for parent, index in edges:
+            with self._lock_for(parent):
+                parent.child_visits[index] += 1 - self._VIRTUAL_LOSS
+
+    def _lock_for(self, node: MCTSNode) -> threading.Lock:
+        return self._locks[hash(node) % self._LOCK_STRIPES]
+
+    def _simulate_parallel(self, state: GameState) -> List[PlayerType | None]:
+        futures = [self._executor().submit(_simulate_worker, state.copy(), self.tablebase_path, self.rollout_spec, self.rng.getrandbits(64))
+                   for _ in range(self.leaf_batch)]
+        return [future.result() for future in futures]
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # workers are started on first use and kept for the following moves
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
     
     def _limits_reached(self, start_time: float, iterations: int):
+        if self._stop is not None and self._stop.is_set():
+            return True
         if self.iter_limit and iterations >= self.iter_limit:
             return True
-        if time.time() - start_time > self.time_limit:
+        if not self.iterations_only and time.time() - start_time > self.time_limit:
             return True
-        return False
\ No newline at end of file
+        return False
+
+
+def _no_clock() -> float:
+    # stands in for time.perf_counter while a search isn't profiled
+    return 0.0
+
+
+def _reachable(root: MCTSNode) -> Set[int]:
+    # ids of the nodes reachable from `root`, the DAG is walked once per node
+    seen = {id(root)}
+    stack = [root]
+    while stack:
+        for child in stack.pop().children:
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+    return seen
+
+
+def _root_parallel_worker(state: GameState, start_time: float, time_limit: float, iter_limit: int, seed: int, 
+                          tablebase: str | None, rollout_policy: str, selection: str, 
+                          widening: float | None, iterations_only: bool) -> Tuple[List[RootStat], int]:
+    mcts = MCTS(time_limit=time_limit, iter_limit=iter_limit, reuse_tree=False, tablebase=tablebase, 
+                rollout_policy=rollout_policy, selection=selection, widening=widening, seed=seed, 
+                iterations_only=iterations_only)
+    root = mcts._new_root(state)
+    iterations = mcts._grow_tree(root, state, start_time)
+    return root.child_stats(), iterations
+
+
+def _simulate_worker(state: GameState, tablebase: str | None, rollout_policy: str, seed: int) -> PlayerType | None:
+    return MCTSNode(state).simulate(state, open_tablebase(tablebase) if tablebase else None, make_policy(rollout_policy),
+                                    random.Random(seed))
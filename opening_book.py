@@ -0,0 +1,155 @@
+import argparse
+import logging
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Tuple
+
+from bitboard_state import BitboardGameState
+from custom_types import Move, PlayerType, decode_move, encode_move
+from mtcs_engine import MCTS
+
+logger = logging.getLogger(__name__)
+
+# Book moves for the first plies of the game, found by long offline searches. The file
+# holds the magic, the number of plies covered and the number of records, then one
+# record per position sorted by key: zobrist hash of the position (uint64), the move
+# packed by encode_move (uint32) and the searched win rate of the side to move (float16).
+MAGIC = b'CKOB1'
+_HEADER = struct.Struct('<5sBI')
+_RECORD = struct.Struct('<QIe')
+
+_PLIES = 8
+_ITERATIONS = 20000
+
+
+class BookEntry(NamedTuple):
+    move: Move
+    win_rate: float
+
+
+class OpeningBook:
+    """An opening book file, held in a dict keyed by zobrist hash."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, self.plies, count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an opening book file")
+        self._entries: Dict[int, Tuple[int, float]] = {}
+        for key, code, win_rate in _RECORD.iter_unpack(data[_HEADER.size:_HEADER.size + count * _RECORD.size]):
+            self._entries[key] = (code, win_rate)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, state) -> BookEntry | None:
+        found = self._entries.get(state.zobrist)
+        if found is None:
+            return None
+        move = decode_move(found[0])
+        # a hash collision would give a move from another position
+        if move not in state.try_generate_moves():
+            return None
+        return BookEntry(move, found[1])
+
+
+_OPEN: Dict[str, OpeningBook] = {}
+
+
+def open_book(path: str) -> OpeningBook:
+    book = _OPEN.get(path)
+    if book is None:
+        book = _OPEN[path] = OpeningBook(path)
+    return book
+
+
+def _replay(moves: List[Move]) -> BitboardGameState:
+    state = BitboardGameState()
+    for move in moves:
+        state.apply_move(move)
+    return state
+
+
+def _search_position(moves: List[Move], iterations: int, seed: int, rollout_policy: str) -> Tuple[int, Move, float]:
+    # runs in a worker process
+    state = _replay(moves)
+    mcts = MCTS(time_limit=float('inf'), iter_limit=iterations, reuse_tree=False, rollout_policy=rollout_policy,
+                seed=seed, iterations_only=True)
+    snapshot = None
+    for snapshot in mcts.search_iter(state):
+        pass
+    return state.zobrist, snapshot.best_move, snapshot.win_rate
+
+
+def build(path: str, plies: int = _PLIES, iterations: int = _ITERATIONS, workers: int | None = None,
+          seed: int = 0, rollout_policy: str = 'uniform'):
+    # The book side plays its book move, the other side every legal move. This is done
+    # once with the book on black and once on white, and the two trees share entries
+    # for positions they have in common.
+    book: Dict[int, Tuple[Move, float]] = {}
+    # (position hash, book side) -> moves from the initial position
+    frontier: Dict[Tuple[int, PlayerType], List[Move]] = {
+        (BitboardGameState().zobrist, side): [] for side in PlayerType
+    }
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for ply in range(plies):
+            start = time.time()
+            pending: Dict[int, List[Move]] = {}
+            for (key, side), moves in frontier.items():
+                state = _replay(moves)
+                # a single legal move needs no book entry, the search plays it at once
+                if state.player == side and key not in book and len(state.try_generate_moves()) > 1:
+                    pending[key] = moves
+            futures = [pool.submit(_search_position, moves, iterations, seed + index, rollout_policy)
+                       for index, moves in enumerate(pending.values())]
+            for future in futures:
+                key, move, win_rate = future.result()
+                book[key] = (move, win_rate)
+            logger.info(f"ply {ply + 1}/{plies}: searched {len(pending)} positions in {time.time() - start:.1f}s")
+
+            following: Dict[Tuple[int, PlayerType], List[Move]] = {}
+            for (key, side), moves in frontier.items():
+                state = _replay(moves)
+                status = state.status()
+                if status.is_over:
+                    continue
+                if state.player != side:
+                    replies = status.moves
+                else:
+                    replies = [book[key][0]] if key in book else status.moves[:1]
+                for reply in replies:
+                    undo = state.apply_move(reply)
+                    following.setdefault((state.zobrist, side), moves + [reply])
+                    state.unmake_move(undo)
+            frontier = following
+
+    records = []
+    for key, (move, win_rate) in sorted(book.items()):
+        code = encode_move(move)
+        if code > 0xFFFFFFFF:
+            logger.warning(f"move {move} does not fit in a book record, skipped")
+            continue
+        records.append(_RECORD.pack(key, code, win_rate))
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, plies, len(records)))
+        file.write(b''.join(records))
+    logger.info(f"wrote {len(records)} book positions to {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    logger.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description="Build an opening book by long MCTS searches over the first plies.")
+    parser.add_argument('output')
+    parser.add_argument('--plies', type=int, default=_PLIES)
+    parser.add_argument('--iterations', type=int, default=_ITERATIONS, help="MCTS iterations per book position")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rollout-policy', default='uniform')
+    args = parser.parse_args()
+    build(args.output, args.plies, args.iterations, args.workers, args.seed, args.rollout_policy)
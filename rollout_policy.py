@@ -0,0 +1,105 @@
+import math
+import random
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List
+
+from custom_types import Move, PlayerType
+from game_state import GameState
+
+
+class RolloutPolicy(ABC):
+    """Picks the moves of a playout and may cut it short with a static evaluation."""
+
+    # plies before evaluate() ends the playout, None plays on to the end of the game
+    max_plies: int | None = None
+
+    # `rng` is the search's random.Random (or the random module), policies draw only from it
+    @abstractmethod
+    def choose(self, state: GameState, moves: List[Move], rng: random.Random) -> Move:
+        ...
+
+    def evaluate(self, state: GameState, rng: random.Random) -> PlayerType | None:
+        return None
+
+
+class UniformPolicy(RolloutPolicy):
+    def choose(self, state: GameState, moves: List[Move], rng: random.Random) -> Move:
+        return rng.choice(moves)
+
+
+class HeuristicPolicy(RolloutPolicy):
+    _CHAIN_WEIGHT = 4.0 # per jump beyond the first, longer chains take more pieces
+    _PROMOTION_WEIGHT = 4.0
+    _UNSAFE_WEIGHT = 0.25 # landing where an adjacent enemy can jump straight back
+
+    def choose(self, state: GameState, moves: List[Move], rng: random.Random) -> Move:
+        if len(moves) == 1:
+            return moves[0]
+        weights = [self._weight(state, move) for move in moves]
+        return rng.choices(moves, weights)[0]
+
+    def _weight(self, state: GameState, move: Move) -> float:
+        weight = self._CHAIN_WEIGHT ** (len(move) - 2)
+        (row, col), (last_row, last_col) = move[0], move[-1]
+        player = state.player
+
+        promotion_row = 7 if player == PlayerType.BLACK else 0
+        if last_row == promotion_row and not state.tile(row, col).is_king:
+            weight *= self._PROMOTION_WEIGHT
+
+        if len(move) == 2 and self._exposed(state, player, row, col, last_row, last_col):
+            weight *= self._UNSAFE_WEIGHT
+        return weight
+
+    def _exposed(self, state: GameState, player: PlayerType, row: int, col: int, last_row: int, last_col: int) -> bool:
+        # only adjacent attackers are considered, kings jumping from afar are missed
+        for dir_row, dir_col in ((1, -1), (1, 1), (-1, -1), (-1, 1)):
+            attacker_row, attacker_col = last_row + dir_row, last_col + dir_col
+            behind_row, behind_col = last_row - dir_row, last_col - dir_col
+            if not (state.is_inside_board(attacker_row, attacker_col) and state.is_inside_board(behind_row, behind_col)):
+                continue
+            attacker = state.tile(attacker_row, attacker_col)
+            if not attacker.is_set or attacker.color == player:
+                continue
+            # the attacker jumps in direction -dir_row, men only capture forward
+            if not attacker.is_king and -dir_row != (1 if attacker.color == PlayerType.BLACK else -1):
+                continue
+            if (behind_row, behind_col) == (row, col) or not state.tile(behind_row, behind_col).is_set:
+                return True
+        return False
+
+
+class EvaluationPolicy(RolloutPolicy):
+    _KING_VALUE = 3.0 # in men
+    _SCALE = 0.75 # material lead to win probability, through a sigmoid
+
+    def __init__(self, max_plies: int = 20, playout: RolloutPolicy | None = None):
+        self.max_plies = max_plies
+        self.playout = playout or UniformPolicy()
+
+    def choose(self, state: GameState, moves: List[Move], rng: random.Random) -> Move:
+        return self.playout.choose(state, moves, rng)
+
+    def evaluate(self, state: GameState, rng: random.Random) -> PlayerType | None:
+        # the winner is drawn from the material balance, so backpropagation still sees a game result
+        score = 0.0
+        for player, sign in ((PlayerType.BLACK, 1), (PlayerType.WHITE, -1)):
+            kings = state.king_count(player)
+            score += sign * (state.piece_count(player) - kings + self._KING_VALUE * kings)
+        black_wins = 1 / (1 + math.exp(-self._SCALE * score))
+        return PlayerType.BLACK if rng.random() < black_wins else PlayerType.WHITE
+
+
+POLICIES: Dict[str, Callable[..., RolloutPolicy]] = {
+    'uniform': UniformPolicy,
+    'heuristic': HeuristicPolicy,
+    'evaluation': EvaluationPolicy,
+}
+
+
+def make_policy(spec: str) -> RolloutPolicy:
+    # "uniform", "heuristic", "evaluation" or "evaluation:30" for a cutoff after 30 plies
+    name, _, argument = spec.partition(':')
+    if name not in POLICIES:
+        raise ValueError(f"unknown rollout policy: {name}")
+    return POLICIES[name](int(argument)) if argument else POLICIES[name]()
@@ -0,0 +1,90 @@
+import argparse
+import logging
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Set
+
+from bot import Bot, parse_bot_config
+from game_records import GameRecord, RecordWriter
+from match import play_game
+
+logger = logging.getLogger(__name__)
+
+
+def play_record(black_name: str, black_config: Dict[str, Any], white_name: str, white_config: Dict[str, Any],
+                seed: int, max_plies: int) -> GameRecord:
+    # runs in a worker process, bots are built per game so no tree is carried between games
+    # a seed in a bot's configuration wins over the one derived from the game seed
+    rng = random.Random(seed)
+    black = Bot(**{'seed': rng.getrandbits(64), **black_config})
+    white = Bot(**{'seed': rng.getrandbits(64), **white_config})
+    try:
+        result = play_game(black, white, max_plies=max_plies)
+    finally:
+        black.close()
+        white.close()
+
+    return GameRecord(
+        result.winner, seed, black_name, white_name, result.moves,
+        [snapshot.win_rate for snapshot in result.snapshots],
+        [[(stat.move, stat.visits) for stat in snapshot.stats] for snapshot in result.snapshots],
+    )
+
+
+def run_selfplay(path: str, games: int, configs: Dict[str, Dict[str, Any]], workers: int | None = None,
+                 seed: int = 0, max_plies: int = 200, swap_colors: bool = True) -> int:
+    # plays `games` games between the first two configs (or one config against itself)
+    # and appends each record to `path` as soon as it is finished
+    names = list(configs)
+    first, second = names[0], names[-1]
+    workers = workers or os.cpu_count() or 1
+
+    with RecordWriter(path) as writer, ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: Set[Future] = set()
+        # only a few games are queued ahead, the results are never held all at once
+        max_pending = 2 * workers
+        game = 0
+        while game < games or pending:
+            while game < games and len(pending) < max_pending:
+                black, white = (second, first) if swap_colors and game % 2 else (first, second)
+                pending.add(pool.submit(play_record, black, configs[black], white, configs[white], seed + game, max_plies))
+                game += 1
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                writer.write(record)
+                logger.info(f"game {writer.written}/{games}: {record.black} vs {record.white}, "
+                            f"winner={record.winner}, plies={len(record.moves)}")
+        return writer.written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless self-play, games are appended to a binary record file.")
+    parser.add_argument('output', help="record file, appended to if it exists")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--bot', action='append', default=[], metavar='NAME=SPEC',
+                        help="bot configuration such as 'strong=iter_limit=2000,mode=tree_parallel', given once or twice")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-plies', type=int, default=200)
+    parser.add_argument('--no-swap', action='store_true', help="keep the first bot on black")
+    return parser.parse_args(argv)
+
+
+def _parse_bots(specs) -> Dict[str, Dict[str, Any]]:
+    configs = {}
+    for spec in specs or ['default=']:
+        name, _, config = spec.partition('=')
+        configs[name] = parse_bot_config(config)
+    if len(configs) > 2:
+        raise ValueError("self-play takes one or two bot configurations")
+    return configs
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    logger.setLevel(logging.INFO)
+    args = parse_args()
+    run_selfplay(args.output, args.games, _parse_bots(args.bot), args.workers, args.seed, args.max_plies, not args.no_swap)
@@ -0,0 +1,252 @@
+import argparse
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from itertools import combinations
+from typing import Dict, List, NamedTuple, Tuple
+
+from bitboard_state import BETWEEN, COORD_SQUARES, BitboardGameState
+from custom_types import Move, PlayerType
+
+logger = logging.getLogger(__name__)
+
+# Exact results for kings-only endgames. A position is keyed from the side to move:
+# key = own kings mask << 32 | opponent kings mask (kings move the same way in every
+# direction, so colours don't matter). The file holds the magic, the largest piece
+# count covered and the number of records, then one record per won or lost position
+# sorted by key: key (uint64), result (uint8) and plies to the end with best play
+# (uint16). Covered positions that have no record are draws.
+MAGIC = b'CKTB1'
+_HEADER = struct.Struct('<5sBI')
+_RECORD = struct.Struct('<QBH')
+_KEY = struct.Struct('<Q')
+
+WIN, LOSS = 1, 2
+_MAX_PIECES = 4
+
+
+class Probe(NamedTuple):
+    winner: PlayerType | None # None is a draw
+    plies: int # to the end of the game with best play, 0 for draws
+
+
+class Tablebase:
+    """Read-only view of a tablebase file, probed by binary search over a memory map."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_pieces, self.count = _HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a tablebase file")
+
+    def covers(self, black: int, white: int, kings: int) -> bool:
+        pieces = black | white
+        return kings == pieces and pieces.bit_count() <= self.max_pieces
+
+    def probe(self, state) -> Probe | None:
+        # exact result for the state, None when the position is not in the table
+        if state.piece_count(PlayerType.BLACK) + state.piece_count(PlayerType.WHITE) > self.max_pieces:
+            return None
+        black, white, kings = state.position_masks()
+        return self.probe_masks(black, white, kings, state.player)
+
+    def probe_masks(self, black: int, white: int, kings: int, player: PlayerType) -> Probe | None:
+        if not self.covers(black, white, kings):
+            return None
+        opponent = PlayerType.WHITE if player == PlayerType.BLACK else PlayerType.BLACK
+        own, other = (black, white) if player == PlayerType.BLACK else (white, black)
+        if not own:
+            return Probe(opponent, 0)
+        if not other:
+            return Probe(player, 0)
+
+        key = own << 32 | other
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            (middle_key,) = _KEY.unpack_from(self._data, _HEADER.size + middle * _RECORD.size)
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            found_key, result, plies = _RECORD.unpack_from(self._data, _HEADER.size + low * _RECORD.size)
+            if found_key == key:
+                return Probe(player if result == WIN else opponent, plies)
+        return Probe(None, 0)
+
+    def best_move(self, state) -> Tuple[Move, Probe] | None:
+        # the quickest win, else a draw, else the longest loss; None when not covered
+        if self.probe(state) is None:
+            return None
+
+        best = None
+        for move in state.try_generate_moves():
+            undo = state.apply_move(move)
+            probe = self.probe(state)
+            state.unmake_move(undo)
+            if best is None or _preference(probe, state.player) > _preference(best[1], state.player):
+                best = (move, probe)
+        return best
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+
+def _preference(probe: Probe, player: PlayerType) -> Tuple[int, int]:
+    if probe.winner == player:
+        return 2, -probe.plies
+    if probe.winner is None:
+        return 1, 0
+    return 0, probe.plies
+
+
+_OPEN: Dict[str, Tablebase] = {}
+
+
+def open_tablebase(path: str) -> Tablebase:
+    # one mapping per file and process, shared by every search that uses it
+    tablebase = _OPEN.get(path)
+    if tablebase is None:
+        tablebase = _OPEN[path] = Tablebase(path)
+    return tablebase
+
+
+def _successors(own: int, other: int) -> List[int]:
+    # keys of the positions after each legal move, seen from the opponent
+    state = BitboardGameState.from_masks(own, other, own | other, PlayerType.BLACK, zobrist=0)
+    keys = []
+    for move in state.try_generate_moves():
+        squares = [COORD_SQUARES[row][col] for row, col in move]
+        captured = 0
+        for origin, target in zip(squares, squares[1:]):
+            captured |= BETWEEN[origin][target] & other
+        moved = own & ~(1 << squares[0]) | 1 << squares[-1]
+        keys.append((other & ~captured) << 32 | moved)
+    return keys
+
+
+class _SolvedClass(NamedTuple):
+    keys: array # sorted keys of the won and lost positions
+    values: array # result << 14 | plies, parallel to keys
+
+
+def _lookup(solved: Dict[Tuple[int, int], _SolvedClass], key: int) -> Tuple[int, int] | None:
+    own, other = key >> 32, key & 0xFFFFFFFF
+    if not own:
+        return LOSS, 0
+    table = solved[own.bit_count(), other.bit_count()]
+    index = bisect_left(table.keys, key)
+    if index < len(table.keys) and table.keys[index] == key:
+        value = table.values[index]
+        return value >> 14, value & 0x3FFF
+    return None
+
+
+def _solve_classes(classes: List[Tuple[int, int]], solved: Dict[Tuple[int, int], _SolvedClass]):
+    # retrograde analysis over classes that only move into each other (a vs b and b vs a),
+    # captures lead into smaller classes that are already solved
+    positions = [
+        sum(1 << square for square in own) << 32 | sum(1 << square for square in other)
+        for own_count, other_count in classes
+        for own in combinations(range(32), own_count)
+        for other in combinations([square for square in range(32) if square not in own], other_count)
+    ]
+    index = {key: position for position, key in enumerate(positions)}
+    count = len(positions)
+
+    predecessors = [array('I') for _ in range(count)]
+    unresolved_moves = array('I', bytes(4 * count)) # successors not yet known to win for the opponent
+    escapes = bytearray(count) # a move into a smaller class that doesn't lose
+    longest_loss = array('H', bytes(2 * count))
+    buckets: Dict[int, List[Tuple[int, int]]] = {} # plies -> (position, result) to settle at that depth
+
+    for position, key in enumerate(positions):
+        own, other = key >> 32, key & 0xFFFFFFFF
+        successors = _successors(own, other)
+        if not successors:
+            buckets.setdefault(0, []).append((position, LOSS))
+            continue
+
+        quickest_win = None
+        for successor in successors:
+            inside = index.get(successor)
+            if inside is not None:
+                predecessors[inside].append(position)
+                unresolved_moves[position] += 1
+                continue
+            known = _lookup(solved, successor)
+            if known is None:
+                escapes[position] = 1
+            elif known[0] == LOSS:
+                quickest_win = known[1] + 1 if quickest_win is None else min(quickest_win, known[1] + 1)
+            else:
+                longest_loss[position] = max(longest_loss[position], known[1] + 1)
+
+        if quickest_win is not None:
+            buckets.setdefault(quickest_win, []).append((position, WIN))
+        elif not unresolved_moves[position] and not escapes[position]:
+            buckets.setdefault(longest_loss[position], []).append((position, LOSS))
+
+    # settle positions in order of depth, so wins get the shortest and losses the longest line
+    results = bytearray(count)
+    plies_to_end = array('H', bytes(2 * count))
+    depth = 0
+    while buckets:
+        for position, result in buckets.pop(depth, []):
+            if results[position]:
+                continue
+            results[position], plies_to_end[position] = result, depth
+            for predecessor in predecessors[position]:
+                if results[predecessor]:
+                    continue
+                if result == LOSS:
+                    buckets.setdefault(depth + 1, []).append((predecessor, WIN))
+                    continue
+                unresolved_moves[predecessor] -= 1
+                if not unresolved_moves[predecessor] and not escapes[predecessor]:
+                    loss_depth = max(depth + 1, longest_loss[predecessor])
+                    buckets.setdefault(loss_depth, []).append((predecessor, LOSS))
+        depth += 1
+
+    for own_count, other_count in classes:
+        solved[own_count, other_count] = _SolvedClass(array('Q'), array('H'))
+    for key in sorted(position_key for position_key, position in index.items() if results[position]):
+        position = index[key]
+        table = solved[(key >> 32).bit_count(), (key & 0xFFFFFFFF).bit_count()]
+        table.keys.append(key)
+        table.values.append(results[position] << 14 | plies_to_end[position])
+
+
+def build(path: str, max_pieces: int = _MAX_PIECES):
+    solved: Dict[Tuple[int, int], _SolvedClass] = {}
+    for total in range(2, max_pieces + 1):
+        for own_count in range(1, total // 2 + 1):
+            other_count = total - own_count
+            classes = [(own_count, other_count)] if own_count == other_count else [(own_count, other_count), (other_count, own_count)]
+            start = time.time()
+            _solve_classes(classes, solved)
+            logger.info(f"solved {' and '.join(f'{a}v{b}' for a, b in classes)} kings in {time.time() - start:.1f}s")
+
+    records = sorted((key, value) for table in solved.values() for key, value in zip(table.keys, table.values))
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, max_pieces, len(records)))
+        for key, value in records:
+            file.write(_RECORD.pack(key, value >> 14, value & 0x3FFF))
+    logger.info(f"wrote {len(records)} won and lost positions to {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Build the kings-only endgame tablebase by retrograde analysis.")
+    parser.add_argument('output')
+    parser.add_argument('--max-pieces', type=int, default=_MAX_PIECES)
+    args = parser.parse_args()
+    build(args.output, args.max_pieces)
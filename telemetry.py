@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PHASES = ('selection', 'expansion', 'simulation', 'backpropagation')
+_CALLS = ('move_generation', 'apply_move', 'unmake_move')
+
+
+class SearchProfile:
+    """Phase timings and counters of one search, filled in by MCTS._grow_tree."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = dict.fromkeys(_PHASES, 0.0)
+        # time spent in the state's methods during rollouts, part of the simulation phase
+        self.calls: Dict[str, float] = dict.fromkeys(_CALLS, 0.0)
+        self.copy = 0.0
+        self.rollouts = self.rollout_plies = self.max_rollout = 0
+        self.descents = self.descent_depth = self.max_descent = 0
+        self.nodes_allocated = 0
+
+    def add_iteration(self, started: float, selected: float, expanded: float, simulated: float, finished: float,
+                      depth: int, allocated: bool, rollout: int | None):
+        # `rollout` is the plies of the iteration's rollout, None when it ran in another process
+        self.phases['selection'] += selected - started
+        self.phases['expansion'] += expanded - selected
+        self.phases['simulation'] += simulated - expanded
+        self.phases['backpropagation'] += finished - simulated
+        self.descents += 1
+        self.descent_depth += depth
+        self.max_descent = max(self.max_descent, depth)
+        self.nodes_allocated += allocated
+        if rollout is not None:
+            self.rollouts += 1
+            self.rollout_plies += rollout
+            self.max_rollout = max(self.max_rollout, rollout)
+
+
+class TimedState:
+    """Stands in for the search state during a profiled rollout and times the calls made on it."""
+
+    def __init__(self, state, profile: SearchProfile):
+        self._state = state
+        self._calls = profile.calls
+        self.plies = 0
+
+    def __getattr__(self, name: str):
+        return getattr(self._state, name)
+
+    def status(self):
+        start = time.perf_counter()
+        status = self._state.status()
+        self._calls['move_generation'] += time.perf_counter() - start
+        return status
+
+    def apply_move(self, move):
+        start = time.perf_counter()
+        undo = self._state.apply_move(move)
+        self._calls['apply_move'] += time.perf_counter() - start
+        self.plies += 1
+        return undo
+
+    def unmake_move(self, undo):
+        start = time.perf_counter()
+        self._state.unmake_move(undo)
+        self._calls['unmake_move'] += time.perf_counter() - start
+
+    def take_plies(self) -> int:
+        # plies applied since the last call
+        plies, self.plies = self.plies, 0
+        return plies
+
+
+def tree_shape(root) -> Dict[str, float]:
+    # nodes reachable from the root, the depth of the deepest one and the branching so far
+    seen = {id(root)}
+    level = [root]
+    depth = expanded = children = 0
+    while level:
+        following = []
+        for node in level:
+            if node.children:
+                expanded += 1
+                children += len(node.children)
+            for child in node.children:
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    following.append(child)
+        if following:
+            depth += 1
+        level = following
+    return {
+        'nodes': len(seen), 'max_depth': depth, 'root_width': len(root.children),
+        'mean_width': children / expanded if expanded else 0.0,
+    }
+
+
+class Telemetry:
+    """Appends one JSON line of metrics per search and optionally keeps a Prometheus text file.
+
+    Searches only pay for instrumentation when they are given a Telemetry, otherwise the
+    search loop makes one check per iteration.
+    """
+
+    def __init__(self, path: str, prometheus: str | None = None):
+        self.path = path
+        self.prometheus = prometheus
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+        self._totals: Dict[Tuple[str, str], float] = {}
+        self._last: Dict[str, float] = {}
+
+    def record(self, metrics: Dict[str, Any]):
+        line = json.dumps(metrics, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            if self.prometheus:
+                self._update_prometheus(metrics)
+
+    def _update_prometheus(self, metrics: Dict[str, Any]):
+        self._add('checkers_mcts_searches_total', '', 1)
+        self._add('checkers_mcts_iterations_total', '', metrics['iterations'])
+        self._add('checkers_mcts_search_seconds_total', '', metrics['elapsed'])
+        for phase, seconds in metrics.get('phases', {}).items():
+            self._add('checkers_mcts_phase_seconds_total', f'phase="{phase}"', seconds)
+        for call, seconds in metrics.get('rollout_calls', {}).items():
+            self._add('checkers_mcts_rollout_call_seconds_total', f'call="{call}"', seconds)
+        if 'rollouts' in metrics:
+            self._add('checkers_mcts_rollouts_total', '', metrics['rollouts']['count'])
+            self._add('checkers_mcts_rollout_plies_total', '', metrics['rollouts']['plies'])
+
+        self._last = {'checkers_mcts_last_iterations_per_second': metrics['iterations_per_sec']}
+        for key, value in metrics.get('tree', {}).items():
+            self._last[f'checkers_mcts_last_tree_{key}'] = value
+        if 'nodes_allocated' in metrics:
+            self._last['checkers_mcts_last_nodes_allocated'] = metrics['nodes_allocated']
+
+        lines: List[str] = []
+        previous = None
+        for (name, labels), value in sorted(self._totals.items()):
+            if name != previous:
+                lines.append(f"# TYPE {name} counter")
+                previous = name
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        for name, value in sorted(self._last.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        # written whole and renamed, so a scraper never reads a half-written file
+        temporary = self.prometheus + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary, self.prometheus)
+
+    def _add(self, name: str, labels: str, value: float):
+        self._totals[name, labels] = self._totals.get((name, labels), 0) + value
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_OPEN: Dict[Tuple[str, str | None], Telemetry] = {}
+
+
+def open_telemetry(path: str, prometheus: str | None = None) -> Telemetry:
+    # one sink per file, shared by every bot of the process that writes to it
+    telemetry = _OPEN.get((path, prometheus))
+    if telemetry is None:
+        if any(open_path == path for open_path, _ in _OPEN):
+            raise ValueError(f"telemetry {path} is already open with a different Prometheus file")
+        telemetry = _OPEN[path, prometheus] = Telemetry(path, prometheus)
+    return telemetry
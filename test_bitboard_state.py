@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from bitboard_state import BLACK_PROMOTION, WHITE_PROMOTION, BitboardGameState
+from custom_types import PlayerType, board_masks, masks_board
+from game_state import GameState
+
+# Differential tests: BitboardGameState against GameState, on seeded random games and on
+# random king-heavy positions, where the capture search (long chains, kings sliding over
+# squares vacated earlier in the chain) is most involved.
+
+_GAMES = 400
+_POSITIONS = 2000
+_MAX_PLIES = 200
+
+
+def _move_list(moves):
+    return sorted(tuple(move) for move in moves)
+
+
+def _assert_same(state: GameState, bitboard: BitboardGameState):
+    assert bitboard.position_masks() == state.position_masks()
+    assert board_masks(bitboard.board) == board_masks(state.board)
+    assert bitboard.player == state.player
+    assert bitboard.zobrist == state.zobrist
+    assert _move_list(bitboard.try_generate_moves()) == _move_list(state.try_generate_moves())
+    assert bitboard.winner() == state.winner()
+    assert bitboard.is_draw() == state.is_draw()
+    for player in PlayerType:
+        assert bitboard.piece_count(player) == state.piece_count(player)
+        assert bitboard.king_count(player) == state.king_count(player)
+
+
+def _assert_round_trips(state):
+    # every legal move applied and taken back leaves the state as it was
+    before = (state.position_masks(), state.player, state.zobrist, state.quiet_plies, list(state.history))
+    moves = _move_list(state.try_generate_moves())
+    for move in state.try_generate_moves():
+        undo = state.apply_move(move)
+        state.unmake_move(undo)
+        assert (state.position_masks(), state.player, state.zobrist, state.quiet_plies, list(state.history)) == before
+    assert _move_list(state.try_generate_moves()) == moves
+
+
+@pytest.mark.parametrize('seed', range(_GAMES))
+def test_random_game(seed):
+    rng = random.Random(seed)
+    state, bitboard = GameState(), BitboardGameState()
+    for _ in range(_MAX_PLIES):
+        _assert_same(state, bitboard)
+        _assert_round_trips(state)
+        _assert_round_trips(bitboard)
+        if state.status().is_over:
+            break
+        move = rng.choice(state.try_generate_moves())
+        state.apply_move(move)
+        bitboard.apply_move(move)
+
+
+def _random_position(rng: random.Random):
+    squares = rng.sample(range(32), rng.randint(2, 14))
+    black = white = kings = 0
+    for square in squares:
+        bit = 1 << square
+        if rng.random() < 0.5:
+            black |= bit
+        else:
+            white |= bit
+        if rng.random() < 0.6:
+            kings |= bit
+    # men never stand on their own promotion row
+    kings |= black & BLACK_PROMOTION | white & WHITE_PROMOTION
+    return black, white, kings, rng.choice(list(PlayerType))
+
+
+def test_random_positions():
+    rng = random.Random(2024)
+    for _ in range(_POSITIONS):
+        black, white, kings, player = _random_position(rng)
+        state = GameState(masks_board(black, white, kings), player)
+        bitboard = BitboardGameState.from_masks(black, white, kings, player)
+        _assert_same(state, bitboard)
+        _assert_round_trips(state)
+        _assert_round_trips(bitboard)
+
+
+def test_copy_keeps_position():
+    rng = random.Random(7)
+    state = GameState()
+    for _ in range(30):
+        state.apply_move(rng.choice(state.try_generate_moves()))
+    bitboard = BitboardGameState.from_game_state(state)
+    _assert_same(state, bitboard)
+    _assert_same(state.copy(), bitboard.copy())
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from custom_types import PlayerType
+from game_records import MAGIC, GameRecord, RecordWriter, encode_record, read_records
+
+
+def _record(seed: int) -> GameRecord:
+    moves = [[(2, 1), (3, 0)], [(5, 2), (4, 1)], [(3, 0), (5, 2)]]
+    return GameRecord(PlayerType.BLACK if seed % 2 else None, seed, 'strong', 'weak', moves,
+                      [0.5, 0.25, 0.75], [[(move, seed + 1)] for move in moves])
+
+
+def _write(path, seeds):
+    with RecordWriter(str(path)) as writer:
+        for seed in seeds:
+            writer.write(_record(seed))
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'games.bin'
+    _write(path, range(3))
+    assert list(read_records(str(path))) == [_record(seed) for seed in range(3)]
+
+
+def test_append(tmp_path):
+    path = tmp_path / 'games.bin'
+    _write(path, range(2))
+    _write(path, range(2, 4))
+    assert [record.seed for record in read_records(str(path))] == [0, 1, 2, 3]
+
+
+# bytes of the last record that were written before the crash
+@pytest.mark.parametrize('written', [0, 2, 4, 9, -1])
+def test_resume_after_crash(tmp_path, written):
+    # a crash mid-write leaves the start of the last record, resuming drops it before appending
+    path = tmp_path / 'games.bin'
+    _write(path, range(3))
+    last = len(encode_record(_record(2)))
+    with open(path, 'r+b') as file:
+        file.truncate(os.path.getsize(path) - last + written % last)
+    assert [record.seed for record in read_records(str(path))] == [0, 1]
+
+    _write(path, [10, 11])
+    assert [record.seed for record in read_records(str(path))] == [0, 1, 10, 11]
+
+
+def test_resume_after_crash_in_magic(tmp_path):
+    path = tmp_path / 'games.bin'
+    path.write_bytes(MAGIC[:2])
+    _write(path, [5])
+    assert [record.seed for record in read_records(str(path))] == [5]
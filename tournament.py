@@ -0,0 +1,229 @@
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from enum import Enum
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from bitboard_state import BitboardGameState
+from bot import Bot, parse_bot_config
+from custom_types import Move, PlayerType
+from match import play_game
+
+logger = logging.getLogger(__name__)
+
+# Candidate against baseline in colour-swapped pairs: both games of a pair start from the
+# same random opening, once with the candidate on black and once on white, so a lopsided
+# opening cancels out within the pair. Results are scored per pair (0, 1/2, ..., 2 points),
+# the pentanomial model, which keeps the correlation between the two games.
+
+_OPENING_PLIES = 4
+_MAX_PLIES = 200
+_SPRT_MIN_PAIRS = 10 # the variance estimate of a handful of pairs is too unreliable to stop on
+_Z = {0.9: 1.645, 0.95: 1.96, 0.99: 2.576}
+
+
+class PairResult(NamedTuple):
+    pair: int
+    opening: List[Move]
+    scores: Tuple[float, float] # candidate's score with black, then with white
+    plies: Tuple[int, int]
+
+
+def random_opening(seed: int, plies: int) -> List[Move]:
+    rng = random.Random(seed)
+    state = BitboardGameState()
+    moves: List[Move] = []
+    for _ in range(plies):
+        status = state.status()
+        if status.is_over:
+            break
+        move = rng.choice(status.moves)
+        state.apply_move(move)
+        moves.append(move)
+    return moves
+
+
+def _opening_state(moves: List[Move]) -> BitboardGameState:
+    state = BitboardGameState()
+    for move in moves:
+        state.apply_move(move)
+    return state
+
+
+def _score(winner: PlayerType | None, color: PlayerType) -> float:
+    if winner is None:
+        return 0.5
+    return 1.0 if winner == color else 0.0
+
+
+def play_pair(pair: int, candidate: Dict[str, Any], baseline: Dict[str, Any], seed: int,
+              opening_plies: int, max_plies: int) -> PairResult:
+    # runs in a worker process, fresh bots so no tree is carried over from another game
+    opening = random_opening(seed + pair, opening_plies)
+    rng = random.Random(seed + pair)
+    scores, plies = [], []
+    for color in (PlayerType.BLACK, PlayerType.WHITE):
+        candidate_bot = Bot(**{'seed': rng.getrandbits(64), **candidate})
+        baseline_bot = Bot(**{'seed': rng.getrandbits(64), **baseline})
+        try:
+            if color == PlayerType.BLACK:
+                result = play_game(candidate_bot, baseline_bot, _opening_state(opening), max_plies)
+            else:
+                result = play_game(baseline_bot, candidate_bot, _opening_state(opening), max_plies)
+        finally:
+            candidate_bot.close()
+            baseline_bot.close()
+        scores.append(_score(result.winner, color))
+        plies.append(result.plies)
+    return PairResult(pair, opening, (scores[0], scores[1]), (plies[0], plies[1]))
+
+
+def elo(score: float) -> float:
+    # Elo difference of an expected score under the logistic model
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def expected_score(elo_difference: float) -> float:
+    return 1 / (1 + 10 ** (-elo_difference / 400))
+
+
+def _pair_stats(pair_scores: List[float]) -> Tuple[float, float]:
+    # mean and variance of the per-game score of a pair (pair points / 2)
+    count = len(pair_scores)
+    mean = sum(pair_scores) / count / 2
+    variance = sum((score / 2 - mean) ** 2 for score in pair_scores) / count
+    return mean, variance
+
+
+def elo_estimate(pair_scores: List[float], confidence: float = 0.95) -> Dict[str, float]:
+    if not pair_scores:
+        return {'elo': 0.0, 'elo_low': -math.inf, 'elo_high': math.inf, 'score': 0.5}
+    mean, variance = _pair_stats(pair_scores)
+    margin = _Z[confidence] * math.sqrt(variance / len(pair_scores))
+    return {'elo': elo(mean), 'elo_low': elo(mean - margin), 'elo_high': elo(mean + margin), 'score': mean}
+
+
+class SPRT:
+    """Sequential probability ratio test of H0: elo = elo0 against H1: elo = elo1.
+
+    Uses the normal approximation of the generalized SPRT on pair scores: the log-likelihood
+    ratio is compared after every pair with the bounds set by the error rates alpha and beta.
+    """
+
+    def __init__(self, elo0: float, elo1: float, alpha: float = 0.05, beta: float = 0.05):
+        self.elo0, self.elo1 = elo0, elo1
+        self.alpha, self.beta = alpha, beta
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def llr(self, pair_scores: List[float]) -> float:
+        if len(pair_scores) < _SPRT_MIN_PAIRS:
+            return 0.0
+        mean, variance = _pair_stats(pair_scores)
+        if variance == 0:
+            return 0.0
+        score0, score1 = expected_score(self.elo0), expected_score(self.elo1)
+        return len(pair_scores) * (score1 - score0) * (2 * mean - score0 - score1) / (2 * variance)
+
+    def decision(self, llr: float) -> str | None:
+        # 'H1' accepts the candidate as at least elo1 stronger, 'H0' as not more than elo0
+        if llr >= self.upper:
+            return 'H1'
+        if llr <= self.lower:
+            return 'H0'
+        return None
+
+
+def run(candidate: Dict[str, Any], baseline: Dict[str, Any], pairs: int, workers: int | None = None,
+        seed: int = 0, opening_plies: int = _OPENING_PLIES, max_plies: int = _MAX_PLIES,
+        sprt: SPRT | None = None, confidence: float = 0.95) -> Dict[str, Any]:
+    start = time.time()
+    results: List[PairResult] = []
+    llr, decision = 0.0, None
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        pending = {pool.submit(play_pair, pair, candidate, baseline, seed, opening_plies, max_plies)
+                   for pair in range(pairs)}
+        while pending and decision is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results.append(future.result())
+            pair_scores = [sum(result.scores) for result in results]
+            estimate = elo_estimate(pair_scores, confidence)
+            if sprt is not None:
+                llr = sprt.llr(pair_scores)
+                decision = sprt.decision(llr)
+            logger.info(f"{len(results)}/{pairs} pairs: elo={estimate['elo']:+.1f} "
+                        f"[{estimate['elo_low']:+.1f}, {estimate['elo_high']:+.1f}]"
+                        + (f", llr={llr:.2f} ({sprt.lower:.2f}, {sprt.upper:.2f})" if sprt is not None else ""))
+        if pending:
+            # queued pairs are dropped, only the ones already being played are waited for
+            pool.shutdown(cancel_futures=True)
+            logger.info(f"stopped after {len(results)} pairs: {decision}")
+
+    games = [score for result in results for score in result.scores]
+    pair_scores = [sum(result.scores) for result in results]
+    report = {
+        'candidate': _report_config(candidate),
+        'baseline': _report_config(baseline),
+        'seed': seed,
+        'pairs': len(results),
+        'games': len(games),
+        'wins': games.count(1.0), 'draws': games.count(0.5), 'losses': games.count(0.0),
+        # pairs scoring 0, 1/2, 1, 3/2 and 2 points
+        'pentanomial': [pair_scores.count(points / 2) for points in range(5)],
+        'confidence': confidence,
+        **elo_estimate(pair_scores, confidence),
+        'seconds': time.time() - start,
+    }
+    if sprt is not None:
+        report['sprt'] = {'elo0': sprt.elo0, 'elo1': sprt.elo1, 'alpha': sprt.alpha, 'beta': sprt.beta,
+                          'llr': llr, 'lower': sprt.lower, 'upper': sprt.upper, 'decision': decision}
+    return report
+
+
+def _report_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    # JSON-safe copy of a bot configuration: no time budget is null, enums are their values
+    return {key: None if value == math.inf else value.value if isinstance(value, Enum) else value
+            for key, value in config.items()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Play colour-swapped bot vs bot pairs in parallel and report Elo.")
+    parser.add_argument('--candidate', default='', help="bot configuration such as 'iter_limit=800,rollout_policy=evaluation'")
+    parser.add_argument('--baseline', default='')
+    parser.add_argument('--pairs', type=int, default=50, help="maximum number of colour-swapped game pairs")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--opening-plies', type=int, default=_OPENING_PLIES, help="random plies played before each pair")
+    parser.add_argument('--max-plies', type=int, default=_MAX_PLIES, help="a game still running after this is a draw")
+    parser.add_argument('--confidence', type=float, default=0.95, choices=sorted(_Z))
+    parser.add_argument('--sprt', nargs=2, type=float, default=None, metavar=('ELO0', 'ELO1'),
+                        help="stop early once H0: elo=ELO0 or H1: elo=ELO1 is accepted")
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--output', default=None, help="JSON file, stdout if not given")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    logger.setLevel(logging.INFO)
+    args = parse_args()
+    # a side without a budget in its configuration searches by iterations only
+    candidate = {'time_limit': float('inf'), **parse_bot_config(args.candidate)}
+    baseline = {'time_limit': float('inf'), **parse_bot_config(args.baseline)}
+    sprt = SPRT(*args.sprt, args.alpha, args.beta) if args.sprt else None
+    report = json.dumps(run(candidate, baseline, args.pairs, args.workers, args.seed, args.opening_plies,
+                            args.max_plies, sprt, args.confidence), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+    else:
+        print(report)
@@ -0,0 +1,43 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, Set, TypeVar
+
+T = TypeVar('T')
+
+
+class TranspositionTable(Generic[T]):
+    """Bounded map from Zobrist hash to search node, least recently used entries are evicted first."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[int, T] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_create(self, key: int, factory: Callable[[], T]) -> T:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            entry = factory()
+            self._entries[key] = entry
+            if len(self._entries) > self.max_size:
+                # evicted nodes stay alive in the tree, they just can't be shared anymore
+                self._entries.popitem(last=False)
+            return entry
+
+    def retain(self, keep: Set[int]):
+        # keeps only the entries whose node id is in `keep`, in their LRU order
+        with self._lock:
+            self._entries = OrderedDict((key, entry) for key, entry in self._entries.items() if id(entry) in keep)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
@@ -1,6 +1,9 @@
 import tkinter as tk
 import logging
-from custom_types import PlayerType
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from custom_types import Coord, Move, PlayerType
 from game_state import GameState
 from bot import Bot
 
@@ -9,29 +12,57 @@ logger = logging.getLogger(__name__)
 class CheckersUI:
     selected = None
     legal_destinations = set()
-    bot = Bot()
     human_last_move = None
     bot_last_move = None
     
     CELL_SIZE = 50
+    POLL_MS = 50 # how often the Tk loop checks for the bot's answer
     
-    def __init__(self, root, state: GameState, human_player=PlayerType.WHITE):
+    def __init__(self, root, state: GameState, human_player=PlayerType.WHITE, ponder: bool = False,
+                 bot: Bot | None = None):
         self.root = root
         self.state = state
         self.human_player = human_player
+        self.ponder = ponder
+        # one bot per board, its search tree and limits can't be shared between games
+        self.bot = bot or Bot()
+        
+        # searches run off the Tk thread, one at a time since the bot's tree is not shared
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self._bot_future: Future | None = None
+        self._move_stop: threading.Event | None = None
+        self._ponder_stop: threading.Event | None = None
+        # legal moves of the player to move, generated once per turn
+        self._turn_moves: List[Move] | None = None
         
         self.canvas = tk.Canvas(root, width=400, height=400)
         self.canvas.pack()
         self.canvas.bind("<Button-1>", self.on_click)
 
+        self._create_items()
         self.draw_board()
         
         if self.state.player != self.human_player:
             self.root.after(200, self.show_bot_move)
 
+    def _create_items(self):
+        # every canvas item is made once, draw_board only reconfigures the squares that changed
+        size = self.CELL_SIZE
+        self._items: Dict[Coord, Tuple[int, int, int]] = {}
+        self._drawn: Dict[Coord, tuple] = {}
+        for row, col in self.state.board.iter_coords():
+            x0,y0 = col*size, row*size
+            x1,y1 = x0+size, y0+size
+            color = "#EEE" if (row+col)%2==0 else "#666"
+            self.canvas.create_rectangle(x0,y0,x1,y1, fill=color)
+            frame = self.canvas.create_rectangle(x0+3,y0+3,x1-3,y1-3, outline="#ff0", width=3, state="hidden")
+            piece = self.canvas.create_oval(x0+5,y0+5,x1-5,y1-5, state="hidden")
+            crown = self.canvas.create_text((x0+x1)//2,(y0+y1)//2, text="K", fill="red", state="hidden")
+            self._items[row, col] = (frame, piece, crown)
+            # what the square shows: destination frame, (color, king, highlighted) or None
+            self._drawn[row, col] = (False, None)
+
     def draw_board(self):
-        self.canvas.delete("all")
-        
         # collect highlighted positions: current selection and last move destinations
         highlights = set()
         if self.selected:
@@ -41,26 +72,28 @@ class CheckersUI:
         if self.bot_last_move:
             highlights.add(self.bot_last_move[-1])
         
-        for row, col, _ in self.state.board.iter_tiles():
-            x0,y0 = col*self.CELL_SIZE, row*self.CELL_SIZE
-            x1,y1 = x0+self.CELL_SIZE, y0+self.CELL_SIZE
-            color = "#EEE" if (row+col)%2==0 else "#666"
-            self.canvas.create_rectangle(x0,y0,x1,y1, fill=color)
-
-            if (row, col) in self.legal_destinations:
-                self.canvas.create_rectangle(x0+3,y0+3,x1-3,y1-3, outline="#ff0", width=3)
-            piece = self.state.board.tiles[row][col]
-            if not piece.is_set:
+        for row, col, piece in self.state.board.iter_tiles():
+            square = (row, col)
+            look = (square in self.legal_destinations,
+                    (piece.color, piece.is_king, square in highlights) if piece.is_set else None)
+            if self._drawn.get(square) == look:
                 continue
-                
+            self._drawn[square] = look
             
-            fill = "white" if piece.color==PlayerType.WHITE else "black"
-            if (row,col) in highlights:
-                self.canvas.create_oval(x0+5,y0+5,x1-5,y1-5, fill=fill, outline="red", width=3)
+            frame, oval, crown = self._items[square]
+            destination, shown = look
+            self.canvas.itemconfigure(frame, state="normal" if destination else "hidden")
+            if shown is None:
+                self.canvas.itemconfigure(oval, state="hidden")
+                self.canvas.itemconfigure(crown, state="hidden")
+                continue
+            color, is_king, highlighted = shown
+            fill = "white" if color==PlayerType.WHITE else "black"
+            if highlighted:
+                self.canvas.itemconfigure(oval, state="normal", fill=fill, outline="red", width=3)
             else:
-                self.canvas.create_oval(x0+5,y0+5,x1-5,y1-5, fill=fill)
-            if piece.is_king:
-                self.canvas.create_text((x0+x1)//2,(y0+y1)//2, text="K", fill="red")
+                self.canvas.itemconfigure(oval, state="normal", fill=fill, outline="black", width=1)
+            self.canvas.itemconfigure(crown, state="normal" if is_king else "hidden")
 
     def on_click(self, event):
         if self.state.player != self.human_player:
@@ -79,13 +112,12 @@ class CheckersUI:
             if tile.is_set and tile.color == self.human_player:
                 self.selected = (row,col)
                 logger.info(f"human selected piece: {self.selected}")
-                moves = self.state.try_generate_moves()
                 self.legal_destinations = {
-                    m[-1] for m in moves if len(m) >= 2 and m[0] == self.selected
+                    m[-1] for m in self._legal_moves() if len(m) >= 2 and m[0] == self.selected
                 }
                 self.draw_board()
         else:
-            legal_moves = self.state.try_generate_moves()
+            legal_moves = self._legal_moves()
             logger.debug(f"human attempt to move from {self.selected}, legal_moves={len(legal_moves)}")
             for move in legal_moves:
                 if len(move) < 2 or move[0] != self.selected:
@@ -93,7 +125,9 @@ class CheckersUI:
                 
                 if move[-1] == (row, col):
                     logger.info(f"human move chosen: {move}")
+                    self._stop_pondering()
                     self.state.apply_move(move)
+                    self._turn_moves = None
                     self.human_last_move = move
                     self.selected = None
                     self.legal_destinations = set()
@@ -103,24 +137,77 @@ class CheckersUI:
             self.selected = None
             self.draw_board()
 
+    def _legal_moves(self) -> List[Move]:
+        # the selection click and the confirming click share one generation per turn
+        if self._turn_moves is None:
+            self._turn_moves = self.state.try_generate_moves()
+        return self._turn_moves
+
     def show_bot_move(self):
-        if self.state.player != self.human_player:
+        if self.state.player != self.human_player and self._bot_future is None:
+            if self._show_if_over():
+                return
             logger.info("bot is thinking...")
-            move = self.bot.get_move(self.state)
+            # the worker gets its own copy, the board here keeps being drawn meanwhile
+            self._move_stop = threading.Event()
+            self._bot_future = self._worker.submit(self.bot.get_move, self.state.copy(), self._move_stop)
+            self.root.after(self.POLL_MS, self._poll_bot_move)
+            return
             
-            if move:
-                logger.info(f"bot move: {move}")
-                self.bot_last_move = move
-                self.state.apply_move(move)
-                
-            self.draw_board()
+        self._show_if_over()
+
+    def close(self):
+        # a running search returns at its next iteration once stopped, then the bot can go
+        self._stop_pondering()
+        if self._move_stop is not None:
+            self._move_stop.set()
+        self._worker.shutdown(cancel_futures=True)
+        self.bot.close()
+
+    def _poll_bot_move(self):
+        if not self._bot_future.done():
+            self.root.after(self.POLL_MS, self._poll_bot_move)
+            return
+        
+        try:
+            move = self._bot_future.result()
+        except Exception as error:
+            # the search failed in the worker, the game stops on the bot's turn
+            logger.exception(f"bot search failed: {error!r}")
+            self._show_message("BOT ERROR")
+            return
+        finally:
+            self._bot_future = self._move_stop = None
+        if move:
+            logger.info(f"bot move: {move}")
+            self.bot_last_move = move
+            self.state.apply_move(move)
+            self._turn_moves = None
             
-        if self.state.winner():
-            self.show_winner()
+        self.draw_board()
+        if not self._show_if_over() and self.ponder:
+            self._start_pondering()
+
+    def _start_pondering(self):
+        self._ponder_stop = threading.Event()
+        self._worker.submit(self.bot.ponder, self.state.copy(), self._ponder_stop)
 
-    def show_winner(self):
-        winner = self.state.winner()
+    def _stop_pondering(self):
+        if self._ponder_stop is not None:
+            self._ponder_stop.set()
+            self._ponder_stop = None
+
+    def _show_if_over(self) -> bool:
+        status = self.state.status()
+        if status.is_over:
+            self.show_winner(status.winner)
+        return status.is_over
+
+    def show_winner(self, winner):
         logger.info(f"game finished, winner: {winner}")
         
         result_message = "DRAW" if winner is None else ("YOU WON!" if winner==self.human_player else "BOT WON!")
-        self.canvas.create_text(200,200,text=result_message, fill="red", font=("Arial",24))
\ No newline at end of file
+        self._show_message(result_message)
+
+    def _show_message(self, text: str):
+        self.canvas.create_text(200,200,text=text, fill="red", font=("Arial",24))
\ No newline at end of file
@@ -0,0 +1,48 @@
+import random
+from typing import List
+
+from custom_types import PlayerType, Board
+
+# fixed seed so every process (and every run) hashes a position to the same key
+_rng = random.Random(0x2F0B)
+
+# PIECE_KEYS[color][is_king][square] over the 32 dark squares, square = row * 4 + col // 2
+PIECE_KEYS = {
+    color: [[_rng.getrandbits(64) for _ in range(32)] for __ in range(2)]
+    for color in (PlayerType.BLACK, PlayerType.WHITE)
+}
+WHITE_TO_MOVE_KEY = _rng.getrandbits(64)
+
+
+def square_index(row: int, col: int) -> int:
+    return row * 4 + col // 2
+
+
+def piece_key(color: PlayerType, is_king: bool, row: int, col: int) -> int:
+    return PIECE_KEYS[color][is_king][square_index(row, col)]
+
+
+def hash_board(board: Board, player: PlayerType) -> int:
+    key = WHITE_TO_MOVE_KEY if player == PlayerType.WHITE else 0
+    for row, col, tile in board.iter_tiles():
+        if tile.is_set and tile.color is not None:
+            key ^= piece_key(tile.color, tile.is_king, row, col)
+    return key
+
+
+def _mask_keys(mask: int, keys: List[int]) -> int:
+    key = 0
+    while mask:
+        low = mask & -mask
+        key ^= keys[low.bit_length() - 1]
+        mask ^= low
+    return key
+
+
+def hash_masks(black: int, white: int, kings: int, player: PlayerType) -> int:
+    key = WHITE_TO_MOVE_KEY if player == PlayerType.WHITE else 0
+    key ^= _mask_keys(black & ~kings, PIECE_KEYS[PlayerType.BLACK][False])
+    key ^= _mask_keys(black & kings, PIECE_KEYS[PlayerType.BLACK][True])
+    key ^= _mask_keys(white & ~kings, PIECE_KEYS[PlayerType.WHITE][False])
+    key ^= _mask_keys(white & kings, PIECE_KEYS[PlayerType.WHITE][True])
+    return key